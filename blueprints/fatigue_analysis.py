@@ -1,15 +1,28 @@
 import os
+import json
+import time
 import uuid
 import traceback
 import logging
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 import sqlite3
 import cv2
 import subprocess
 from datetime import datetime
-from neural_network.predict import analyze_source
+from concurrent.futures import ThreadPoolExecutor
+from neural_network.predict import analyze_source, quick_score
+from neural_network.video_probe import MAX_VIDEO_LENGTH, MAX_FLIGHT_VIDEO_LENGTH
+from neural_network.live_sessions import get_session_manager, LiveSessionError
+from neural_network.model_registry import get_model_registry
+from neural_network.flight_phases import build_phase_plan
+from neural_network.cpu_budget import THREAD_BUDGET
 from blueprints.auth import token_required
-from utils.date_utils import get_current_datetime
+from utils.date_utils import get_current_datetime, parse_datetime_from_db
+from utils.video_catalog import register_video, find_video, remove_video, is_video_suitable, is_video_current
+from utils.analysis_jobs import (submit_job, start_job, create_job, update_job, get_job, progress_reporter,
+                                 JobExistsError)
+from utils.flight_scheduler import (get_flight_scheduler, claim_flight, release_flight, flight_job,
+                                    AUTO_ANALYSIS_ENABLED)
 
 # Setup logging for errors only
 fatigue_logger = logging.getLogger('fatigue_analysis')
@@ -31,17 +44,28 @@ VIDEO_DIR = os.path.join('neural_network', 'data', 'video')
 os.makedirs(VIDEO_DIR, exist_ok=True)
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'webm', 'mkv'}
 
+# (flight, employee) pairs accepted by one /analyze-flights request
+MAX_BATCH_ANALYSES = 50
+
+# Server-sent events settings for /progress
+SSE_POLL_INTERVAL = 0.5
+SSE_HEARTBEAT_INTERVAL = 15
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_video_file_path(filename):
-    """Find video file path by filename only"""
-    # Remove any path prefixes and use only the filename
+def normalize_video_name(filename):
+    """Remove any path prefixes and use only the filename"""
     if filename.startswith('/videos/'):
         filename = filename[8:]  # Remove '/videos/' prefix
     elif filename.startswith('/video/'):
         filename = filename[7:]  # Remove '/video/' prefix
+    return filename
+
+def get_video_file_path(filename):
+    """Find video file path by filename only"""
+    filename = normalize_video_name(filename)
     
     # Check if file exists in video directory
     full_path = os.path.join(VIDEO_DIR, filename)
@@ -55,12 +79,172 @@ def get_video_file_path(filename):
     
     return None
 
+def resolve_video(conn, filename, employee_id):
+    """Resolve a video through the FatigueVideos catalog.
+    
+    Catalogued videos are found with a single indexed query; files that are not
+    catalogued yet are located on disk once and registered. A catalogued file
+    that was replaced is registered again, a deleted one is dropped.
+    Returns (full_path, catalog_row) or (None, None).
+    """
+    filename = normalize_video_name(filename)
+    
+    video = find_video(conn, filename)
+    if video:
+        full_path = os.path.join(VIDEO_DIR, video['video_path'])
+        if is_video_current(VIDEO_DIR, video):
+            return full_path, video
+        if os.path.exists(full_path):
+            return full_path, register_video(conn, VIDEO_DIR, video['video_path'], video['employee_id'],
+                                             original_filename=video['original_filename'])
+        remove_video(conn, video['video_path'])
+    
+    full_path = get_video_file_path(filename)
+    if not full_path:
+        return None, None
+    
+    video = register_video(conn, VIDEO_DIR, os.path.relpath(full_path, VIDEO_DIR), employee_id)
+    return full_path, video
+
+def start_preview_analysis(conn, employee_id, video_info, original_name, output_name,
+                           original_filename, request_id):
+    """Store a provisional score from a sparse sample and finish the analysis in the background.
+    
+    request_id is a job registered with create_job; its background run replaces the provisional row.
+    """
+    original_path = os.path.join(VIDEO_DIR, original_name)
+    
+    level, percent, details = quick_score(original_path, video_info=video_info)
+    if details.get('error'):
+        update_job(request_id, state='failed', error=details['error'])
+        remove_video(conn, original_name)
+        os.remove(original_path)
+        return jsonify({
+            'error': details['error'],
+            'details': details
+        }), 400
+    
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO FatigueAnalysis 
+        (employee_id, flight_id, analysis_type, fatigue_level, 
+        neural_network_score, analysis_date, video_path, resolution, fps, analysis_status,
+        model_version)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        employee_id,
+        None,
+        'realtime',
+        level,
+        percent/100 if percent else 0,
+        get_current_datetime(),
+        output_name,
+        details.get('resolution', 'unknown'),
+        details.get('fps', 0),
+        'provisional',
+        details.get('model_version')
+    ))
+    conn.commit()
+    analysis_id = cursor.lastrowid
+    
+    try:
+        start_job(request_id, complete_preview_analysis, analysis_id, employee_id,
+                  original_name, output_name, original_filename, video_info, request_id)
+    except Exception:
+        # Nothing will finish this row: don't leave it provisional forever
+        conn.execute('DELETE FROM FatigueAnalysis WHERE analysis_id = ?', (analysis_id,))
+        conn.commit()
+        raise
+    
+    return jsonify({
+        'status': 'provisional',
+        'analysis_id': analysis_id,
+        'job_id': request_id,
+        'fatigue_level': level,
+        'neural_network_score': percent / 100 if percent else 0,
+        'video_path': output_name,
+        'resolution': details.get('resolution', 'unknown'),
+        'fps': details.get('fps', 0),
+        'face_detection_ratio': details.get('face_detected_ratio', 0),
+        'frames_analyzed': details.get('frames_analyzed', 0)
+    }), 202
+
+def complete_preview_analysis(analysis_id, employee_id, original_name, output_name,
+                              original_filename, video_info, job_id):
+    """Run the full analysis and replace the provisional result in the same FatigueAnalysis row"""
+    original_path = os.path.join(VIDEO_DIR, original_name)
+    output_path = os.path.join(VIDEO_DIR, output_name)
+    
+    conn = sqlite3.connect('database/database.db')
+    conn.row_factory = sqlite3.Row
+    try:
+        level, percent, details = analyze_source(
+            source=original_path,
+            is_video_file=True,
+            output_file=output_path,
+            video_info=video_info,
+            max_duration=MAX_VIDEO_LENGTH,
+            progress_callback=progress_reporter(job_id),
+            request_id=job_id
+        )
+        
+        face_detected = details.get('face_detected_ratio', 0) > 0
+        error_msg = details.get('error')
+        if not face_detected or error_msg or not os.path.exists(output_path):
+            error_msg = error_msg or ('No face detected in the video' if not face_detected
+                                      else 'Failed to create analyzed video')
+            conn.execute('''
+                UPDATE FatigueAnalysis
+                SET fatigue_level = 'Unknown', neural_network_score = 0,
+                    analysis_status = 'failed', notes = ?
+                WHERE analysis_id = ?
+            ''', (error_msg, analysis_id))
+            conn.commit()
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return {'analysis_id': analysis_id, 'status': 'failed', 'error': error_msg}
+        
+        conn.execute('''
+            UPDATE FatigueAnalysis
+            SET fatigue_level = ?, neural_network_score = ?, resolution = ?, fps = ?,
+                analysis_status = 'final', model_version = ?
+            WHERE analysis_id = ?
+        ''', (
+            level,
+            percent/100 if percent else 0,
+            details.get('resolution', 'unknown'),
+            details.get('fps', 0),
+            details.get('model_version'),
+            analysis_id
+        ))
+        conn.commit()
+        register_video(conn, VIDEO_DIR, output_name, employee_id, original_filename=original_filename)
+        
+        return {
+            'analysis_id': analysis_id,
+            'status': 'final',
+            'fatigue_level': level,
+            'neural_network_score': percent / 100 if percent else 0,
+            'face_detection_ratio': details.get('face_detected_ratio', 0),
+            'frames_analyzed': details.get('frames_analyzed', 0)
+        }
+    finally:
+        remove_video(conn, original_name)
+        if os.path.exists(original_path):
+            os.remove(original_path)
+        conn.close()
+
 @fatigue_bp.route('/analyze', methods=['POST'])
 @token_required
 def analyze_fatigue(current_user):
     request_id = str(uuid.uuid4())[:8]
+    # Clients may choose the job id up front to follow /progress/<job_id> while waiting
+    job_id = request.form.get('job_id') or request_id
+    if get_job(job_id):
+        return jsonify({'error': f'Job {job_id} already exists'}), 409
     
     conn = None
+    owns_job = False  # failures below only touch this request's own job
     try:
         if 'video' not in request.files:
             return jsonify({'error': 'No video file provided'}), 400
@@ -92,18 +276,53 @@ def analyze_fatigue(current_user):
                 os.remove(original_path)
                 return jsonify({'error': 'Uploaded video file is empty'}), 400
 
+            # Register the upload in the catalog and reject it before decoding if unusable
+            conn = sqlite3.connect('database/database.db')
+            conn.row_factory = sqlite3.Row
+            video_info = register_video(
+                conn, VIDEO_DIR, original_name, current_user['employee_id'],
+                original_filename=video_file.filename
+            )
+            suitable, reason = is_video_suitable(video_info)
+            if not suitable:
+                remove_video(conn, original_name)
+                os.remove(original_path)
+                return jsonify({'error': reason}), 400
+
+            try:
+                create_job(job_id, employee_id=current_user['employee_id'], state='running')
+            except JobExistsError as e:
+                remove_video(conn, original_name)
+                os.remove(original_path)
+                return jsonify({'error': str(e)}), 409
+            owns_job = True
+
+            # Two-phase mode: provisional score now, full result updates the same row later
+            if request.form.get('mode') == 'preview':
+                return start_preview_analysis(
+                    conn, current_user['employee_id'], video_info, original_name,
+                    output_name, video_file.filename, job_id
+                )
+
             # Analyze the video and save output with visualization
             level, percent, details = analyze_source(
                 source=original_path, 
                 is_video_file=True,
-                output_file=output_path
+                output_file=output_path,
+                video_info=video_info,
+                max_duration=MAX_VIDEO_LENGTH,
+                progress_callback=progress_reporter(job_id),
+                request_id=request_id
             )
+            update_job(job_id, state='failed' if details.get('error') else 'done',
+                       error=details.get('error'))
             
             # Check if a face was detected
             face_detected = details.get('face_detected_ratio', 0) > 0
             error_msg = details.get('error')
             
             if not face_detected or error_msg:
+                remove_video(conn, original_name)
                 os.remove(original_path)
                 if os.path.exists(output_path):
                     os.remove(output_path)
@@ -118,10 +337,6 @@ def analyze_fatigue(current_user):
             if not os.path.exists(output_path):
                 return jsonify({'error': 'Failed to create analyzed video'}), 500
 
-            # Save analysis to database with current local time
-            conn = sqlite3.connect('database/database.db')
-            conn.row_factory = sqlite3.Row
-            
             # Get current datetime in the proper format
             current_datetime = get_current_datetime()
             
@@ -130,8 +345,8 @@ def analyze_fatigue(current_user):
             cursor.execute('''
                 INSERT INTO FatigueAnalysis 
                 (employee_id, flight_id, analysis_type, fatigue_level, 
-                neural_network_score, analysis_date, video_path, resolution, fps)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                neural_network_score, analysis_date, video_path, resolution, fps, model_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 current_user['employee_id'],
                 None,  # No flight for realtime analysis
@@ -141,18 +356,25 @@ def analyze_fatigue(current_user):
                 current_datetime,  # Use local datetime
                 output_name,  # Store only filename
                 details.get('resolution', 'unknown'),
-                details.get('fps', 0)
+                details.get('fps', 0),
+                details.get('model_version')
             ))
             conn.commit()
             analysis_id = cursor.lastrowid
             
-            # Clean up original file (keep only processed version)
+            # Clean up original file (keep only processed version) and catalog the output
+            remove_video(conn, original_name)
             os.remove(original_path)
+            register_video(
+                conn, VIDEO_DIR, output_name, current_user['employee_id'],
+                original_filename=video_file.filename
+            )
             
             # Return the result with video path
             result = {
                 'status': 'success',
                 'analysis_id': analysis_id,
+                'job_id': job_id,
                 'fatigue_level': level,
                 'neural_network_score': percent / 100 if percent else 0,
                 'video_path': output_name,  # Return only filename
@@ -170,8 +392,12 @@ def analyze_fatigue(current_user):
             technical_msg = str(e)
             
             fatigue_logger.error(f"[{request_id}] Processing error: {technical_msg}")
+            if owns_job:
+                update_job(job_id, state='failed', error=technical_msg)
             
             # Clean up any files
+            if conn:
+                remove_video(conn, original_name)
             if os.path.exists(original_path):
                 os.remove(original_path)
             if os.path.exists(output_path):
@@ -197,9 +423,167 @@ def analyze_fatigue(current_user):
         if conn:
             conn.close()
 
+class FlightAnalysisError(Exception):
+    def __init__(self, message, status_code=400, details=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+def prepare_flight_analysis(conn, flight, video_path, employee_id, phase_aware=False, video_start=None):
+    """Resolve and check a flight video before decoding; returns (full_path, catalog row, phases)"""
+    full_video_path, video_info = resolve_video(conn, video_path, employee_id)
+    if not full_video_path:
+        raise FlightAnalysisError(f'Video file not found: {video_path}', 404)
+    
+    suitable, reason = is_video_suitable(video_info)
+    if not suitable:
+        raise FlightAnalysisError(reason)
+
+    phases = None
+    if phase_aware:
+        try:
+            # Recording start defaults to the scheduled departure. Streamed WebM has no duration,
+            # a counted frame count still gives it
+            duration = float(video_info.get('duration') or 0)
+            if not duration and video_info.get('frame_count') and video_info.get('fps'):
+                duration = video_info['frame_count'] / video_info['fps']
+            phases = build_phase_plan(
+                parse_datetime_from_db(flight['departure_time']),
+                parse_datetime_from_db(flight['arrival_time']),
+                duration,
+                video_info.get('fps'),
+                video_start=parse_datetime_from_db(video_start) if video_start else None
+            )
+        except ValueError as e:
+            raise FlightAnalysisError(str(e))
+    return full_video_path, video_info, phases
+
+def analyze_flight_video(flight, employee_ids, full_video_path, video_info, phases, job_id, request_id):
+    """Decode and score a flight video once for employee_ids; safe to run on a worker thread.
+    
+    Only one analysis of a flight runs at a time across all processes, a second
+    one fails with 409 and the running job id in details, as does an analysis
+    of employees who all got their result meanwhile.
+    Returns (level, percent, details, output_name).
+    """
+    claim, remaining = claim_flight(flight['flight_id'], job_id, employee_ids)
+    if claim is None:
+        raise FlightAnalysisError('Flight is already being analyzed', 409,
+                                  details={'job_id': flight_job(flight['flight_id'])})
+    try:
+        if not remaining:
+            raise FlightAnalysisError('Flight analysis already exists', 409)
+
+        # Generate output filename
+        output_name = f"analyzed_flight_{uuid.uuid4()}.mp4"
+        output_path = os.path.join(VIDEO_DIR, output_name)
+        
+        # Analyze the flight video
+        level, percent, details = analyze_source(
+            source=full_video_path, 
+            is_video_file=True,
+            output_file=output_path,
+            video_info=video_info,
+            max_duration=MAX_FLIGHT_VIDEO_LENGTH,
+            progress_callback=progress_reporter(job_id),
+            request_id=request_id,
+            # Stable per flight and video content: a retried request resumes an interrupted analysis
+            checkpoint_key=(f"flight{flight['flight_id']}-{video_info['content_hash'] or video_info['video_id']}"
+                            + ('-phases' if phases else '')),
+            phases=phases
+        )
+    finally:
+        release_flight(claim)
+    
+    # Check if face was detected
+    if details.get('error'):
+        raise FlightAnalysisError(details.get('error'), details=details)
+    return level, percent, details, output_name
+
+def insert_flight_analyses(conn, flight_id, employee_ids, level, percent, details, output_name):
+    """Store a 'flight' FatigueAnalysis row per employee without committing; returns ids by employee_id.
+    
+    Employees that already have a 'flight' analysis of this flight keep it and get its id.
+    """
+    # Get current datetime in the proper format
+    current_datetime = get_current_datetime()
+
+    # Save results with type 'flight'
+    analysis_ids = {}
+    cursor = conn.cursor()
+    for employee_id in employee_ids:
+        existing = cursor.execute('''
+            SELECT analysis_id FROM FatigueAnalysis
+            WHERE employee_id = ? AND flight_id = ? AND analysis_type = 'flight'
+            ORDER BY analysis_id DESC LIMIT 1
+        ''', (employee_id, flight_id)).fetchone()
+        if existing:
+            analysis_ids[employee_id] = existing[0]
+            continue
+        cursor.execute('''
+            INSERT INTO FatigueAnalysis 
+            (employee_id, flight_id, analysis_type, fatigue_level, 
+             neural_network_score, analysis_date, video_path, resolution, fps, model_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            employee_id,
+            flight_id,
+            'flight',
+            level,
+            percent/100 if percent else 0,
+            current_datetime,  # Use local datetime
+            output_name,  # Store only filename
+            details.get('resolution', 'unknown'),
+            details.get('fps', 0),
+            details.get('model_version')
+        ))
+        analysis_ids[employee_id] = cursor.lastrowid
+    return analysis_ids
+
+def run_flight_analysis(conn, flight, employee_ids, video_path, job_id, request_id,
+                        phase_aware=False, video_start=None):
+    """Analyze a flight video once and store a 'flight' FatigueAnalysis row per crew member.
+    
+    Used by the post-arrival scheduler (the whole crew). All rows are inserted
+    in one transaction.
+    Returns (analysis_ids by employee_id, level, percent, details, output_name).
+    """
+    prepared = prepare_flight_analysis(conn, flight, video_path, employee_ids[0],
+                                       phase_aware=phase_aware, video_start=video_start)
+    return finish_flight_analysis(conn, flight, employee_ids, prepared, job_id, request_id)
+
+def finish_flight_analysis(conn, flight, employee_ids, prepared, job_id, request_id):
+    """Decode a video from prepare_flight_analysis() and store the rows, see run_flight_analysis()"""
+    level, percent, details, output_name = analyze_flight_video(
+        flight, employee_ids, *prepared, job_id, request_id)
+
+    analysis_ids = insert_flight_analyses(conn, flight['flight_id'], employee_ids,
+                                          level, percent, details, output_name)
+    conn.commit()
+
+    register_video(conn, VIDEO_DIR, output_name, employee_ids[0])
+    return analysis_ids, level, percent, details, output_name
+
+def complete_flight_analysis(flight, employee_id, prepared, job_id, request_id):
+    """Background job of /analyze-flight; the job result is the new analysis"""
+    conn = sqlite3.connect('database/database.db')
+    conn.row_factory = sqlite3.Row
+    try:
+        analysis_ids, level, percent, details, output_name = finish_flight_analysis(
+            conn, flight, [employee_id], prepared, job_id, request_id)
+        return flight_analysis_result(flight, employee_id, analysis_ids[employee_id], job_id,
+                                      level, percent, details, output_name)
+    finally:
+        conn.close()
+
 @fatigue_bp.route('/analyze-flight', methods=['POST'])
 @token_required
 def analyze_flight(current_user):
+    """Analyze the video of one of the user's flights in the background.
+    
+    Returns an existing analysis with 200; otherwise 202 with the job_id of
+    the running analysis, whose progress and result /progress/<job_id> reports.
+    """
     request_id = str(uuid.uuid4())[:8]
     
     conn = None
@@ -219,7 +603,7 @@ def analyze_flight(current_user):
         
         # Get flight information
         flight = conn.execute('''
-            SELECT f.flight_id, f.from_code, f.to_code, f.video_path, f.arrival_time
+            SELECT f.flight_id, f.from_code, f.to_code, f.video_path, f.departure_time, f.arrival_time
             FROM Flights f
             JOIN CrewMembers cm ON f.crew_id = cm.crew_id
             WHERE cm.employee_id = ?
@@ -229,86 +613,376 @@ def analyze_flight(current_user):
         if not flight:
             return jsonify({'error': 'Flight not found'}), 404
 
-        # Check if analysis already exists for this flight
+        # An analysis already exists (e.g. computed after arrival by the scheduler): return it
         existing_analysis = conn.execute('''
-            SELECT analysis_id FROM FatigueAnalysis 
+            SELECT * FROM FatigueAnalysis 
             WHERE employee_id = ? AND flight_id = ? AND analysis_type = 'flight'
+            ORDER BY analysis_id DESC LIMIT 1
         ''', (current_user['employee_id'], flight_id)).fetchone()
 
         if existing_analysis:
-            return jsonify({'error': 'Flight analysis already exists'}), 409
+            return jsonify(dict(existing_analysis,
+                                from_code=flight['from_code'],
+                                to_code=flight['to_code'],
+                                precomputed=True))
 
-        # Get video file path using standardized function
-        full_video_path = get_video_file_path(video_path)
-        
-        if not full_video_path or not os.path.exists(full_video_path):
-            return jsonify({'error': f'Video file not found: {video_path}'}), 404
+        # The flight is being analyzed right now (scheduler or another request, in any worker):
+        # follow that job instead of decoding twice
+        running_job = flight_job(flight['flight_id'])
+        if running_job:
+            return jsonify({'job_id': running_job, 'state': 'running'}), 202
 
-        # Generate output filename
-        output_name = f"analyzed_flight_{uuid.uuid4()}.mp4"
-        output_path = os.path.join(VIDEO_DIR, output_name)
-        
-        # Analyze the flight video
-        level, percent, details = analyze_source(
-            source=full_video_path, 
-            is_video_file=True,
-            output_file=output_path
-        )
-        
-        # Check if face was detected
-        if details.get('error'):
-            return jsonify({
-                'error': details.get('error'),
-                'details': details
-            }), 400
+        try:
+            prepared = prepare_flight_analysis(conn, flight, video_path, current_user['employee_id'],
+                                               phase_aware=bool(data.get('phases')),
+                                               video_start=data.get('video_start_time'))
+        except FlightAnalysisError as e:
+            body = {'error': str(e)}
+            if e.details is not None:
+                body['details'] = e.details
+            return jsonify(body), e.status_code
 
-        # Get current datetime in the proper format
-        current_datetime = get_current_datetime()
+        # Decoding a flight video takes up to hours: the job runs it, the client follows /progress
+        job_id = data.get('job_id') or request_id
+        try:
+            submit_job(job_id, complete_flight_analysis, dict(flight), current_user['employee_id'],
+                       prepared, job_id, request_id, employee_id=current_user['employee_id'])
+        except JobExistsError as e:
+            return jsonify({'error': str(e)}), 409
+        return jsonify({'job_id': job_id, 'state': 'queued'}), 202
 
-        # Save results with type 'flight'
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO FatigueAnalysis 
-            (employee_id, flight_id, analysis_type, fatigue_level, 
-             neural_network_score, analysis_date, video_path, resolution, fps)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            current_user['employee_id'],
-            flight['flight_id'],
-            'flight',
-            level,
-            percent/100 if percent else 0,
-            current_datetime,  # Use local datetime
-            output_name,  # Store only filename
-            details.get('resolution', 'unknown'),
-            details.get('fps', 0)
-        ))
-        analysis_id = cursor.lastrowid
-        conn.commit()
+    except Exception as e:
+        fatigue_logger.error(f"[{request_id}] Flight analysis error: {traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
 
-        # Return complete analysis data
-        result = {
-            'analysis_id': analysis_id,
-            'fatigue_level': level,
-            'neural_network_score': percent/100 if percent else 0,
-            'video_path': output_name,  # Return only filename
-            'from_code': flight['from_code'],
-            'to_code': flight['to_code'],
-            'resolution': details.get('resolution', 'unknown'),
-            'fps': details.get('fps', 0),
-            'face_detection_ratio': details.get('face_detected_ratio', 0),
-            'frames_analyzed': details.get('frames_analyzed', 0)
-        }
-        
-        return jsonify(result)
+def flight_analysis_result(flight, employee_id, analysis_id, job_id, level, percent, details, output_name):
+    """Response body of a new flight analysis"""
+    result = {
+        'analysis_id': analysis_id,
+        'employee_id': employee_id,
+        'flight_id': flight['flight_id'],
+        'job_id': job_id,
+        'fatigue_level': level,
+        'neural_network_score': percent/100 if percent else 0,
+        'video_path': output_name,  # Return only filename
+        'from_code': flight['from_code'],
+        'to_code': flight['to_code'],
+        'resolution': details.get('resolution', 'unknown'),
+        'fps': details.get('fps', 0),
+        'face_detection_ratio': details.get('face_detected_ratio', 0),
+        'frames_analyzed': details.get('frames_analyzed', 0)
+    }
+    if details.get('phases'):
+        result['phases'] = details.get('phases')
+    return result
+
+@fatigue_bp.route('/analyze-flights', methods=['POST'])
+@token_required
+def analyze_flights_batch(current_user):
+    """Analyze several (flight, employee) pairs, decoding every distinct flight video once.
+    
+    Body: {"flight_id": 12} for the whole crew of a flight, or
+    {"analyses": [{"flight_id": 12, "employee_id": 5}, ...]}, plus the optional
+    "phases" and "video_start_time" of /analyze-flight. Pairs that already have
+    an analysis return it; all new FatigueAnalysis rows are inserted in one
+    transaction. Whole-crew requests and other employees' analyses are
+    admin-only; non-admins may only request their own analyses.
+    """
+    request_id = str(uuid.uuid4())[:8]
+    
+    conn = None
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        conn = sqlite3.connect('database/database.db')
+        conn.row_factory = sqlite3.Row
+        is_admin = current_user['role'] == 'admin'
+
+        try:
+            if data.get('analyses'):
+                if not isinstance(data['analyses'], list) or \
+                        not all(isinstance(item, dict) for item in data['analyses']):
+                    raise TypeError('analyses items must be objects')
+                pairs = [(int(item['flight_id']), int(item.get('employee_id') or current_user['employee_id']))
+                         for item in data['analyses']]
+            elif data.get('flight_id'):
+                if not is_admin:
+                    return jsonify({'error': 'Admin role required'}), 403
+                crew = conn.execute('''
+                    SELECT cm.employee_id
+                    FROM Flights f
+                    JOIN CrewMembers cm ON cm.crew_id = f.crew_id
+                    WHERE f.flight_id = ?
+                ''', (int(data['flight_id']),)).fetchall()
+                pairs = [(int(data['flight_id']), row['employee_id']) for row in crew]
+            else:
+                return jsonify({'error': 'flight_id or analyses are required'}), 400
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'analyses must be a list of {flight_id, employee_id}'}), 400
+
+        # Non-admins only analyze themselves, like every other fatigue endpoint
+        if not is_admin and any(employee_id != current_user['employee_id'] for _, employee_id in pairs):
+            return jsonify({'error': 'Admin role required'}), 403
+
+        pairs = list(dict.fromkeys(pairs))
+        if not pairs:
+            return jsonify({'error': 'Flight not found'}), 404
+        if len(pairs) > MAX_BATCH_ANALYSES:
+            return jsonify({'error': f'At most {MAX_BATCH_ANALYSES} analyses per request'}), 400
+
+        results = {}
+        # Flight video -> flight rows and (flight_id, employee_id) pairs that need it
+        videos = {}
+        for flight_id, employee_id in pairs:
+            flight = conn.execute('''
+                SELECT f.flight_id, f.from_code, f.to_code, f.video_path, f.departure_time, f.arrival_time
+                FROM Flights f
+                JOIN CrewMembers cm ON f.crew_id = cm.crew_id
+                WHERE cm.employee_id = ?
+                    AND f.flight_id = ?
+            ''', (employee_id, flight_id)).fetchone()
+            if not flight:
+                results[(flight_id, employee_id)] = {'flight_id': flight_id, 'employee_id': employee_id,
+                                                     'error': 'Flight not found'}
+                continue
+
+            existing_analysis = conn.execute('''
+                SELECT * FROM FatigueAnalysis 
+                WHERE employee_id = ? AND flight_id = ? AND analysis_type = 'flight'
+                ORDER BY analysis_id DESC LIMIT 1
+            ''', (employee_id, flight_id)).fetchone()
+            if existing_analysis:
+                results[(flight_id, employee_id)] = dict(existing_analysis, precomputed=True)
+                continue
+
+            if not flight['video_path']:
+                results[(flight_id, employee_id)] = {'flight_id': flight_id, 'employee_id': employee_id,
+                                                     'error': 'Flight has no video'}
+                continue
+            video = videos.setdefault(normalize_video_name(flight['video_path']), {'flights': {}, 'pairs': []})
+            video['flights'][flight_id] = flight
+            video['pairs'].append((flight_id, employee_id))
+
+        # Resolve every video on this thread (the connection is not shared), then decode in parallel
+        jobs = []
+        for index, (video_path, video) in enumerate(videos.items()):
+            flight = next(iter(video['flights'].values()))
+            try:
+                prepared = prepare_flight_analysis(conn, flight, video_path, video['pairs'][0][1],
+                                                   phase_aware=bool(data.get('phases')),
+                                                   video_start=data.get('video_start_time'))
+            except FlightAnalysisError as e:
+                for flight_id, employee_id in video['pairs']:
+                    results[(flight_id, employee_id)] = {'flight_id': flight_id, 'employee_id': employee_id,
+                                                         'error': str(e)}
+                continue
+            job_id = create_job(f"{request_id}-{index}", employee_id=current_user['employee_id'], state='running')
+            jobs.append((video, flight, prepared, job_id))
+
+        def run(video, flight, prepared, job_id):
+            try:
+                employee_ids = [employee_id for flight_id, employee_id in video['pairs']
+                                if flight_id == flight['flight_id']]
+                outcome = analyze_flight_video(flight, employee_ids, *prepared, job_id,
+                                               f"{request_id}-{flight['flight_id']}")
+                update_job(job_id, state='done')
+                return outcome
+            except Exception as e:
+                update_job(job_id, state='failed', error=str(e))
+                return e
+
+        outcomes = []
+        if jobs:
+            with ThreadPoolExecutor(max_workers=min(len(jobs), THREAD_BUDGET['analysis_workers'])) as pool:
+                outcomes = list(pool.map(lambda job: run(*job), jobs))
+
+        # One transaction for every new row
+        outputs = []
+        try:
+            for (video, flight, prepared, job_id), outcome in zip(jobs, outcomes):
+                if isinstance(outcome, Exception):
+                    for flight_id, employee_id in video['pairs']:
+                        results[(flight_id, employee_id)] = {'flight_id': flight_id, 'employee_id': employee_id,
+                                                             'job_id': job_id, 'error': str(outcome)}
+                    continue
+                level, percent, details, output_name = outcome
+                outputs.append((output_name, video['pairs'][0][1]))
+                for flight_id, employee_id in video['pairs']:
+                    analysis_ids = insert_flight_analyses(conn, flight_id, [employee_id],
+                                                          level, percent, details, output_name)
+                    results[(flight_id, employee_id)] = flight_analysis_result(
+                        video['flights'][flight_id], employee_id, analysis_ids[employee_id], job_id,
+                        level, percent, details, output_name)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        for output_name, employee_id in outputs:
+            register_video(conn, VIDEO_DIR, output_name, employee_id)
+
+        return jsonify({
+            'request_id': request_id,
+            'videos_analyzed': len(outputs),
+            'results': [results[pair] for pair in pairs]
+        })
 
     except Exception as e:
-        fatigue_logger.error(f"[{request_id}] Flight analysis error: {traceback.format_exc()}")
+        fatigue_logger.error(f"[{request_id}] Batch flight analysis error: {traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
     finally:
         if conn:
             conn.close()
 
+def start_post_arrival_scheduler():
+    """Start background analysis of flight videos after arrival (FATIGUE_AUTO_ANALYSIS=1)"""
+    if not AUTO_ANALYSIS_ENABLED:
+        return False
+    return get_flight_scheduler().start(run_flight_analysis)
+
+@fatigue_bp.route('/scheduler', methods=['GET'])
+@token_required
+def get_scheduler_status(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'error': 'Admin role required'}), 403
+    return jsonify(get_flight_scheduler().status())
+
+@fatigue_bp.route('/progress/<job_id>', methods=['GET'])
+@token_required
+def stream_progress(current_user, job_id):
+    """Server-sent events stream with the progress of a running analysis.
+    
+    With ?format=json the current state is returned once, for clients that poll.
+    """
+    job = get_job(job_id)
+    if not job or current_user['employee_id'] not in job['employee_ids']:
+        return jsonify({'error': 'Analysis job not found'}), 404
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'job_id': job_id,
+            'state': job['state'],
+            'stalled': job['stalled'],
+            'progress': job.get('progress'),
+            'error': job.get('error'),
+            'result': job.get('result') if job['state'] in ('done', 'failed') else None
+        })
+    
+    def events():
+        last_update = None
+        last_sent = time.time()
+        while True:
+            job = get_job(job_id)
+            if job is None:
+                yield 'event: error\ndata: {"error": "Analysis job expired"}\n\n'
+                return
+            
+            if job['updated_at'] != last_update:
+                last_update = job['updated_at']
+                last_sent = time.time()
+                payload = {
+                    'job_id': job_id,
+                    'state': job['state'],
+                    'stalled': job['stalled'],
+                    'progress': job.get('progress'),
+                    'error': job.get('error')
+                }
+                if job['state'] in ('done', 'failed'):
+                    payload['result'] = job.get('result')
+                    yield f"event: {job['state']}\ndata: {json.dumps(payload)}\n\n"
+                    return
+                yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+            elif time.time() - last_sent >= SSE_HEARTBEAT_INTERVAL:
+                last_sent = time.time()
+                yield f": keep-alive stalled={str(job['stalled']).lower()}\n\n"
+            
+            time.sleep(SSE_POLL_INTERVAL)
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@fatigue_bp.route('/live/sessions', methods=['POST'])
+@token_required
+def open_live_session(current_user):
+    try:
+        session = get_session_manager().open_session(current_user['employee_id'])
+        return jsonify({
+            'session_id': session.session_id,
+            'created_at': session.created_at
+        }), 201
+    except LiveSessionError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+@fatigue_bp.route('/live/sessions/<session_id>/frames', methods=['POST'])
+@token_required
+def push_live_frame(current_user, session_id):
+    """Score one encoded frame (raw JPEG/PNG body or multipart 'frame' field)"""
+    try:
+        if 'frame' in request.files:
+            data = request.files['frame'].read()
+        else:
+            data = request.get_data(cache=False)
+        result = get_session_manager().process_frame(session_id, current_user['employee_id'], data)
+        return jsonify(result)
+    except LiveSessionError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"Live frame error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@fatigue_bp.route('/live/sessions/<session_id>', methods=['DELETE'])
+@token_required
+def close_live_session(current_user, session_id):
+    try:
+        result = get_session_manager().close_session(session_id, current_user['employee_id'])
+        return jsonify(result)
+    except LiveSessionError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+MODELS_DIR = os.path.join('neural_network', 'data', 'models')
+
+@fatigue_bp.route('/models', methods=['GET'])
+@token_required
+def get_model_status(current_user):
+    return jsonify(get_model_registry().status())
+
+@fatigue_bp.route('/models/activate', methods=['POST'])
+@token_required
+def activate_model(current_user):
+    """Load a model file from the models directory in the background and switch new analyses to it"""
+    if current_user['role'] != 'admin':
+        return jsonify({'error': 'Admin role required'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    model_path = None
+    if data.get('model'):
+        model_path = os.path.join(MODELS_DIR, os.path.basename(data['model']))
+        if not os.path.exists(model_path):
+            return jsonify({'error': 'Model file not found'}), 404
+    
+    registry = get_model_registry()
+    registry.activate(model_path)
+    return jsonify({'status': 'loading', **registry.status()}), 202
+
+@fatigue_bp.route('/models/rollback', methods=['POST'])
+@token_required
+def rollback_model(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'error': 'Admin role required'}), 403
+    try:
+        get_model_registry().rollback()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(get_model_registry().status())
+
 @fatigue_bp.route('/feedback', methods=['POST'])
 @token_required
 def submit_fatigue_feedback(current_user):
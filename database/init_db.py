@@ -89,6 +89,9 @@ CREATE TABLE Flights (
     conditions TEXT,
     status TEXT DEFAULT 'scheduled' CHECK(status IN ('scheduled', 'in_progress', 'completed', 'cancelled')),
     video_path TEXT,
+    analysis_attempts INTEGER DEFAULT 0,
+    analysis_failed_at TEXT,
+    analysis_error TEXT,
     FOREIGN KEY (crew_id) REFERENCES Crews (crew_id)
 )
 ''')
@@ -104,6 +107,12 @@ CREATE TABLE FatigueVideos (
     resolution TEXT,
     fps REAL,
     duration INTEGER,
+    file_size INTEGER,
+    content_hash TEXT,
+    codec TEXT,
+    frame_count INTEGER,
+    file_name TEXT,
+    file_mtime REAL,
     FOREIGN KEY (employee_id) REFERENCES Employees (employee_id)
 )
 ''')
@@ -122,6 +131,8 @@ CREATE TABLE FatigueAnalysis (
     notes TEXT,
     resolution TEXT,
     fps REAL,
+    analysis_status TEXT DEFAULT 'final' CHECK(analysis_status IN ('provisional', 'final', 'failed')),
+    model_version TEXT,
     FOREIGN KEY (employee_id) REFERENCES Employees (employee_id),
     FOREIGN KEY (flight_id) REFERENCES Flights (flight_id)
 )
@@ -229,6 +240,9 @@ cursor.execute('CREATE INDEX idx_cognitive_tests_employee_id ON CognitiveTests(e
 cursor.execute('CREATE INDEX idx_cognitive_tests_date ON CognitiveTests(test_date)')
 cursor.execute('CREATE INDEX idx_flight_feedback_flight_id ON FlightFeedback(flight_id)')
 cursor.execute('CREATE INDEX idx_fatigue_feedback_analysis_id ON FatigueAnalysisFeedback(analysis_id)')
+cursor.execute('CREATE UNIQUE INDEX idx_fatigue_videos_path ON FatigueVideos(video_path)')
+cursor.execute('CREATE INDEX idx_fatigue_videos_hash ON FatigueVideos(content_hash)')
+cursor.execute('CREATE INDEX idx_fatigue_videos_name ON FatigueVideos(file_name)')
 
 # Create trigger for flight duration calculation
 cursor.execute('''
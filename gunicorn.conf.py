@@ -0,0 +1,54 @@
+"""
+gunicorn configuration for the backend:
+
+    gunicorn -c gunicorn.conf.py routes:app
+
+With FATIGUE_PRELOAD=1 (default) the app and its libraries are imported once
+in the master and shared copy-on-write by the workers; each worker loads the
+model after fork (see neural_network/preload.py).
+
+Workers are threaded (gthread): analyses, /progress streams and live frames
+are served concurrently by FATIGUE_WEB_THREADS threads per process.
+
+Analysis jobs and live sessions live in process memory, so run ONE worker
+process (the default). With FATIGUE_WEB_WORKERS > 1, /progress/<job_id> and
+/live/sessions/<id> only work when the request reaches the process that
+created the job or session (e.g. behind a sticky load balancer).
+"""
+
+import os
+
+bind = os.environ.get('FATIGUE_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('FATIGUE_WEB_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('FATIGUE_WEB_THREADS', 32))
+# gthread workers heartbeat from their main loop, so requests running for hours
+# (6 h flight videos, SSE streams) are not killed; this only catches hung workers
+timeout = 120
+preload_app = os.environ.get('FATIGUE_PRELOAD', '1') == '1'
+
+# Each worker process gets an equal share of the CPU budget. Set before the app
+# (and neural_network.cpu_budget, which sizes the pools at import) is loaded.
+_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+os.environ.setdefault('FATIGUE_CPU_BUDGET', str(max(1, _cpus // workers)))
+
+
+def on_starting(server):
+    if preload_app:
+        from neural_network.preload import preload_parent
+        preload_parent()
+
+
+def pre_fork(server, worker):
+    # CPU slice of the new worker: the lowest one no live worker holds. worker.age keeps
+    # growing as workers are respawned, so age % workers could repeat a live worker's slice.
+    taken = {getattr(live, 'cpu_slot', None) for live in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    from neural_network.preload import init_worker
+    init_worker(worker.cpu_slot % workers, workers)
+    # One worker wins the scheduler lock (see utils/flight_scheduler.py)
+    from blueprints.fatigue_analysis import start_post_arrival_scheduler
+    start_post_arrival_scheduler()
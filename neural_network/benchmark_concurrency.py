@@ -0,0 +1,80 @@
+"""
+Throughput of concurrent video analyses under the CPU thread budget.
+
+Every concurrency level runs in a fresh process, because TensorFlow thread
+pools can only be sized once per process:
+
+    python neural_network/benchmark_concurrency.py --input video.mp4 --levels 1 2 4 8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run_level(video_path: str, concurrency: int, cpus: int = None) -> dict:
+    """Run `concurrency` analyses of the same video at once in this process"""
+    from neural_network.cpu_budget import compute_thread_budget, configure_threads
+    from neural_network.logging_setup import setup_logging
+    setup_logging()
+    budget = configure_threads(compute_thread_budget(cpus=cpus, analysis_workers=concurrency))
+
+    from neural_network.predict import analyze_source, FatigueAnalyzer
+    # Load the model before timing so every level measures analysis only
+    FatigueAnalyzer('neural_network/data/models/fatigue_model.keras').close()
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: analyze_source(video_path, is_video_file=True),
+                                range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    frames = sum(details.get('frames_analyzed', 0) for _, _, details in results)
+    return {
+        'concurrency': concurrency,
+        'budget': budget,
+        'elapsed_seconds': round(elapsed, 2),
+        'frames': frames,
+        'frames_per_second': round(frames / elapsed, 2) if elapsed else 0,
+        'videos_per_minute': round(concurrency / elapsed * 60, 2) if elapsed else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analysis throughput vs concurrency')
+    parser.add_argument('--input', required=True, help='Video file analyzed by every worker')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--cpus', type=int, help='CPU budget (default: FATIGUE_CPU_BUDGET or all CPUs)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--level', type=int, help=argparse.SUPPRESS)  # child process mode
+    args = parser.parse_args()
+
+    if args.level:
+        print(json.dumps(run_level(args.input, args.level, args.cpus)))
+        return
+
+    results = []
+    for level in args.levels:
+        command = [sys.executable, os.path.abspath(__file__), '--input', args.input, '--level', str(level)]
+        if args.cpus:
+            command += ['--cpus', str(args.cpus)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"concurrency={level:<3} {result['frames_per_second']:>8} frames/s  "
+              f"{result['videos_per_minute']:>6} videos/min  "
+              f"(tf intra-op threads {result['budget']['tf_intra_op_threads']})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import os
+import time
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LatestFrameCapture:
+    """Reads a live capture on a background thread and keeps only the newest frame.
+
+    read() returns the most recent frame that has not been consumed yet, so
+    when processing is slower than the camera, stale frames are dropped instead
+    of queueing up in the driver. Drop and latency counters are kept for
+    display and final statistics; call frame_done() after a frame has been
+    processed to record its capture-to-result latency.
+
+    Wraps a cv2.VideoCapture-like object (isOpened/read/get/release).
+    """
+
+    def __init__(self, cap, max_latency_samples: int = 1000):
+        self.cap = cap
+        self._condition = threading.Condition()
+        self._frame = None
+        self._frame_time = 0.0
+        self._sequence = 0
+        self._consumed_sequence = 0
+        self._consumed_frame_time = None
+        self._running = True
+        self._ended = False
+
+        self.frames_captured = 0
+        self.frames_consumed = 0
+        self.frames_dropped = 0
+        self.latencies = []
+        self.max_latency_samples = max_latency_samples
+
+        self._thread = threading.Thread(target=self._capture_loop, name='latest-frame-capture', daemon=True)
+        self._thread.start()
+
+    def _capture_loop(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            with self._condition:
+                if not ret:
+                    self._ended = True
+                    self._condition.notify_all()
+                    return
+                if self._sequence > self._consumed_sequence:
+                    self.frames_dropped += 1
+                self._frame = frame
+                self._frame_time = time.perf_counter()
+                self._sequence += 1
+                self.frames_captured += 1
+                self._condition.notify_all()
+
+    def isOpened(self) -> bool:
+        return self._running and self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def read(self, timeout: float = 5.0):
+        """Wait for a frame newer than the last one returned. Returns (ret, frame)"""
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._sequence > self._consumed_sequence or self._ended or not self._running,
+                    timeout=timeout):
+                return False, None
+            if self._sequence <= self._consumed_sequence:
+                return False, None
+            self._consumed_sequence = self._sequence
+            self._consumed_frame_time = self._frame_time
+            frame = self._frame
+
+        self.frames_consumed += 1
+        return True, frame
+
+    def frame_done(self):
+        """Record the latency from capture of the last read frame until now"""
+        if self._consumed_frame_time is None:
+            return
+        self.latencies.append(time.perf_counter() - self._consumed_frame_time)
+        self._consumed_frame_time = None
+        if len(self.latencies) > self.max_latency_samples:
+            self.latencies.pop(0)
+
+    @property
+    def last_latency_ms(self) -> float:
+        return self.latencies[-1] * 1000 if self.latencies else 0.0
+
+    def stats(self) -> dict:
+        latencies_ms = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            'frames_captured': self.frames_captured,
+            'frames_processed': self.frames_consumed,
+            'frames_dropped': self.frames_dropped,
+            'drop_rate': self.frames_dropped / self.frames_captured if self.frames_captured else 0,
+            'latency_ms_mean': round(float(latencies_ms.mean()), 2),
+            'latency_ms_p50': round(float(np.percentile(latencies_ms, 50)), 2),
+            'latency_ms_p90': round(float(np.percentile(latencies_ms, 90)), 2),
+            'latency_ms_p95': round(float(np.percentile(latencies_ms, 95)), 2),
+            'latency_ms_p99': round(float(np.percentile(latencies_ms, 99)), 2)
+        }
+
+    def release(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=2)
+        self.cap.release()
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.webm', '.mkv')
+
+
+class ReplayCapture:
+    """Plays video files back as if they were a live camera.
+
+    Frames are released on a fixed clock at each file's native FPS: read()
+    sleeps until the next frame is due and never waits for the consumer, so
+    wrapping it in LatestFrameCapture reproduces realtime frame dropping
+    without a webcam. A directory is played file by file; with loop=True
+    playback restarts from the first file.
+    """
+
+    def __init__(self, source: str, loop: bool = False, default_fps: float = 30.0):
+        if os.path.isdir(source):
+            self.paths = sorted(
+                os.path.join(source, name) for name in os.listdir(source)
+                if name.lower().endswith(VIDEO_EXTENSIONS)
+            )
+        else:
+            self.paths = [source]
+        if not self.paths:
+            raise ValueError(f"No video files found in: {source}")
+
+        self.loop = loop
+        self.default_fps = default_fps
+        self._index = -1
+        self._cap = None
+        self._next_frame_time = None
+        self.fps = default_fps
+        self._open_next()
+
+    def _open_next(self) -> bool:
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+        for _ in range(len(self.paths)):
+            self._index += 1
+            if self._index >= len(self.paths):
+                if not self.loop:
+                    return False
+                self._index = 0
+            cap = cv2.VideoCapture(self.paths[self._index])
+            if cap.isOpened():
+                self._cap = cap
+                self.fps = cap.get(cv2.CAP_PROP_FPS) or self.default_fps
+                logger.info(f"Replaying {self.paths[self._index]} at {self.fps:.2f} FPS")
+                return True
+            logger.warning(f"Skipping unreadable video: {self.paths[self._index]}")
+            cap.release()
+        return False
+
+    def isOpened(self) -> bool:
+        return self._cap is not None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return self._cap.get(prop) if self._cap is not None else 0
+
+    def read(self):
+        while self._cap is not None:
+            ret, frame = self._cap.read()
+            if ret:
+                break
+            if not self._open_next():
+                return False, None
+        else:
+            return False, None
+
+        # Hold the frame until its slot on the playback clock
+        now = time.perf_counter()
+        if self._next_frame_time is None:
+            self._next_frame_time = now
+        delay = self._next_frame_time - now
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1.0 / self.fps:
+            # Decoding fell behind: a camera would not deliver the backlog faster
+            self._next_frame_time = now
+        self._next_frame_time += 1.0 / self.fps
+        return True, frame
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
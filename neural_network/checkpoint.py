@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import subprocess
+
+import cv2
+
+from neural_network.file_lock import try_lock, unlock
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.environ.get('FATIGUE_CHECKPOINT_DIR', os.path.join('neural_network', 'data', 'checkpoints'))
+# Seconds of analysis between checkpoints
+CHECKPOINT_INTERVAL = float(os.environ.get('FATIGUE_CHECKPOINT_INTERVAL', 60))
+# Videos at least this long (seconds) are analyzed in long-video mode
+LONG_VIDEO_THRESHOLD = float(os.environ.get('FATIGUE_LONG_VIDEO_THRESHOLD', 30 * 60))
+
+
+def default_checkpoint_key(source: str) -> str:
+    """Key for a video file that changes when the file is replaced"""
+    stat = os.stat(source)
+    identity = f"{os.path.abspath(source)}:{stat.st_size}:{int(stat.st_mtime)}"
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()[:16]
+
+
+class AnalysisCheckpoint:
+    """Resumable progress of one video analysis.
+
+    Progress is a JSON file written atomically (temp file + os.replace), so
+    a crash leaves either the previous or the new checkpoint, never a torn
+    one. The annotated output is written as one segment per checkpoint
+    interval; a checkpoint only lists segments that were closed before it
+    was saved, and the segment open at the time of a crash is discarded.
+
+    Only the process holding acquire() may use a key: two analyses of the
+    same video would otherwise write the same segments and clear() each
+    other's files.
+    """
+
+    def __init__(self, key: str, directory: str = CHECKPOINT_DIR):
+        self.key = key
+        self.directory = os.path.join(directory, key)
+        self.path = os.path.join(self.directory, 'checkpoint.json')
+        self.lock_path = f"{self.directory}.lock"
+        self.segments = []
+        self._lock = None
+
+    def acquire(self) -> bool:
+        """Take the key for this analysis; False while another analysis holds it"""
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        self._lock = try_lock(self.lock_path)
+        return self._lock is not None
+
+    def release(self):
+        unlock(self._lock, remove=True)
+        self._lock = None
+
+    def load(self):
+        """Saved progress or None; also restores the list of finished segments"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+        self.segments = [path for path in state.get('segments', []) if os.path.exists(path)]
+        return state
+
+    def save(self, state: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        state = dict(state, segments=list(self.segments), saved_at=time.time())
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def next_segment_path(self) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"segment_{len(self.segments):04d}.mp4")
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def concat_segments(segments: list, output_file: str, fps: float, frame_size: tuple):
+    """Join output segments into output_file: ffmpeg stream copy, OpenCV re-encode as fallback"""
+    if len(segments) == 1:
+        shutil.copyfile(segments[0], output_file)
+        return
+
+    list_path = f"{output_file}.segments.txt"
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in segments:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    try:
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                        '-i', list_path, '-c', 'copy', output_file], check=True)
+        return
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning(f"ffmpeg concat failed ({e}), re-encoding segments with OpenCV")
+    finally:
+        os.remove(list_path)
+
+    out = cv2.VideoWriter(output_file, cv2.VideoWriter_fourcc(*'H264'), fps, frame_size)
+    for path in segments:
+        cap = cv2.VideoCapture(path)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(frame)
+        cap.release()
+    out.release()
@@ -0,0 +1,123 @@
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> list:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_set(value: str) -> list:
+    """'0-3,6' -> [0, 1, 2, 3, 6]"""
+    cpus = set()
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def compute_thread_budget(cpus: int = None, analysis_workers: int = None) -> dict:
+    """Split one CPU budget between concurrent analyses and the libraries inside them.
+
+    Every concurrent analysis gets cpus // analysis_workers cores: TensorFlow
+    intra-op threads use that share, inter-op and OpenCV stay at one thread
+    (per-face ops are small, parallelism comes from running several analyses),
+    and the ffmpeg decoder gets the same share. MediaPipe graphs have no
+    thread setting and run on the calling analysis thread.
+
+    Defaults come from FATIGUE_CPU_BUDGET (all CPUs available to the process)
+    and FATIGUE_ANALYSIS_WORKERS (half the budget, at least one).
+    """
+    if cpus is None:
+        cpus = int(os.environ.get('FATIGUE_CPU_BUDGET', 0)) or len(available_cpus())
+    if analysis_workers is None:
+        analysis_workers = int(os.environ.get('FATIGUE_ANALYSIS_WORKERS', 0)) or max(1, cpus // 2)
+    per_worker = max(1, cpus // analysis_workers)
+    return {
+        'cpus': cpus,
+        'analysis_workers': analysis_workers,
+        'live_workers': int(os.environ.get('FATIGUE_LIVE_WORKERS', 0)) or analysis_workers,
+        'tf_intra_op_threads': per_worker,
+        'tf_inter_op_threads': 1,
+        'opencv_threads': 1,
+        'ffmpeg_threads': int(os.environ.get('FFMPEG_DECODER_THREADS', 0)) or per_worker
+    }
+
+
+THREAD_BUDGET = compute_thread_budget()
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def configure_threads(budget: dict = None) -> dict:
+    """Apply the budget to TensorFlow and OpenCV once per process.
+
+    Must run before TensorFlow executes its first op; afterwards TF keeps its
+    pools and only a warning is logged. FATIGUE_CPU_SET (e.g. '0-3') pins the
+    process to those CPUs first.
+    """
+    global _configured, THREAD_BUDGET
+    with _configure_lock:
+        if _configured:
+            return THREAD_BUDGET
+
+        cpu_set = os.environ.get('FATIGUE_CPU_SET')
+        if cpu_set:
+            pin_to_cpus(parse_cpu_set(cpu_set))
+
+        if budget is not None:
+            THREAD_BUDGET = budget
+        budget = THREAD_BUDGET
+
+        import cv2
+        import tensorflow as tf
+
+        cv2.setNumThreads(budget['opencv_threads'])
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(budget['tf_intra_op_threads'])
+            tf.config.threading.set_inter_op_parallelism_threads(budget['tf_inter_op_threads'])
+        except RuntimeError as e:
+            logger.warning(f"TensorFlow thread pools already initialized, budget not applied: {e}")
+
+        _configured = True
+        logger.info(f"CPU thread budget: {budget}")
+        return budget
+
+
+def _reset_after_fork():
+    # A forked worker (gunicorn preload) applies the budget again in its own process
+    global _configured, _configure_lock
+    _configured = False
+    _configure_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def pin_to_cpus(cpus: list):
+    """Restrict the current process to the given CPUs (Linux only)"""
+    if not hasattr(os, 'sched_setaffinity'):
+        logger.warning("CPU pinning is not supported on this platform")
+        return
+    os.sched_setaffinity(0, cpus)
+    logger.info(f"Process {os.getpid()} pinned to CPUs {cpus}")
+
+
+def worker_cpu_set(worker_index: int, workers: int) -> list:
+    """Disjoint slice of the available CPUs for one of several worker processes"""
+    cpus = available_cpus()
+    per_worker = max(1, len(cpus) // workers)
+    start = (worker_index % workers) * per_worker
+    return cpus[start:start + per_worker] or cpus
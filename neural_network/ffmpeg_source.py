@@ -0,0 +1,120 @@
+import logging
+import threading
+import subprocess
+from collections import deque
+
+import numpy as np
+
+from neural_network.cpu_budget import THREAD_BUDGET
+
+logger = logging.getLogger(__name__)
+
+DECODER_THREADS = THREAD_BUDGET['ffmpeg_threads']  # FFMPEG_DECODER_THREADS overrides the budget
+# Last ffmpeg stderr lines kept for the log when the decoder is released
+STDERR_TAIL_LINES = 50
+
+
+class FFmpegFrameSource:
+    """Frame source that decodes through an ffmpeg subprocess.
+
+    Scaling and frame-rate reduction run inside ffmpeg (scale/fps filters), so
+    only the pixels and frames the analyzer needs cross the pipe. Frames are
+    read into a single reused buffer: the array returned by read() is only
+    valid until the next read() call.
+
+    Implements the subset of the cv2.VideoCapture interface used by
+    analyze_source (isOpened/grab/read/release), plus seek(). grab() has to
+    decode the frame it skips; seek() restarts ffmpeg at a later position and
+    only decodes from the keyframe before it.
+    """
+
+    def __init__(self, path: str, width: int, height: int, fps: float = None,
+                 threads: int = DECODER_THREADS, start_time: float = None):
+        import ffmpeg
+
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.threads = threads
+        self.frame_size = width * height * 3
+
+        self._buffer = np.empty((height, width, 3), dtype=np.uint8)
+        self._view = memoryview(self._buffer.reshape(-1))
+        self.frames_read = 0
+        self.seeks = 0
+        self._start(ffmpeg, start_time)
+
+    def _start(self, ffmpeg, start_time: float = None):
+        input_args = {'threads': self.threads}
+        if start_time:
+            input_args['ss'] = start_time  # input seek: resume from a checkpoint, seek()
+        stream = ffmpeg.input(self.path, **input_args)
+        if self.fps:
+            stream = stream.filter('fps', fps=self.fps)
+        stream = stream.filter('scale', self.width, self.height)
+        stream = stream.output('pipe:', format='rawvideo', pix_fmt='bgr24')
+        cmd = stream.global_args('-loglevel', 'error', '-nostdin').compile()
+
+        # Restarts by seek() are frequent in sparse phases, only the first start is logged at INFO
+        logger.log(logging.DEBUG if self.seeks else logging.INFO, f"Starting ffmpeg decoder: {' '.join(cmd)}")
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        bufsize=self.frame_size)
+
+        # stderr is drained continuously: a full pipe would block ffmpeg and hang read()
+        self._stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, name='ffmpeg-stderr', daemon=True)
+        self._stderr_thread.start()
+
+    def _drain_stderr(self):
+        for line in self.process.stderr:
+            self._stderr_tail.append(line.decode('utf-8', errors='replace').rstrip())
+
+    def isOpened(self) -> bool:
+        return self.process is not None
+
+    def seek(self, position: float):
+        """Continue decoding at position (seconds in the source)"""
+        import ffmpeg
+
+        self.release()
+        self.seeks += 1
+        self._start(ffmpeg, position)
+
+    def grab(self) -> bool:
+        """Skip the next frame; the raw pipe has no cheaper way than reading it"""
+        ret, _ = self.read()
+        return ret
+
+    def read(self):
+        """Read the next frame into the shared buffer. Returns (ret, frame)"""
+        if self.process is None:
+            return False, None
+
+        filled = 0
+        while filled < self.frame_size:
+            n = self.process.stdout.readinto(self._view[filled:])
+            if not n:
+                if filled:
+                    logger.warning(f"Truncated frame from ffmpeg ({filled}/{self.frame_size} bytes)")
+                return False, None
+            filled += n
+
+        self.frames_read += 1
+        return True, self._buffer
+
+    def release(self):
+        if self.process is None:
+            return
+        self.process.stdout.close()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._stderr_thread.join(timeout=5)
+        self.process.stderr.close()
+        stderr = '\n'.join(self._stderr_tail).strip()
+        if stderr:
+            logger.warning(f"ffmpeg decoder: {stderr}")
+        self.process = None
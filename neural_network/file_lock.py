@@ -0,0 +1,57 @@
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def try_lock(path: str):
+    """Exclusive non-blocking lock on a lock file; returns a handle or None if another process holds it.
+
+    The lock is released by unlock() or when the process exits, so a crash
+    never leaves a stale lock behind.
+    """
+    while True:
+        handle = open(path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            handle.close()
+            return None
+        if fcntl is None or _is_current(handle, path):
+            return handle
+        # The previous holder removed the file after we opened it: lock the file now at path
+        handle.close()
+
+
+def _is_current(handle, path: str) -> bool:
+    try:
+        return os.stat(path).st_ino == os.fstat(handle.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def unlock(handle, remove: bool = False):
+    """Release a lock from try_lock; remove=True deletes the lock file while still holding it"""
+    if handle is None:
+        return
+    if remove:
+        try:
+            os.remove(handle.name)
+        except OSError:
+            pass  # Windows cannot remove an open file; it is reused next time
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+    handle.close()
@@ -0,0 +1,82 @@
+import os
+import bisect
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Critical phases: (name, schedule anchor, window start and end in seconds relative to the anchor)
+CRITICAL_PHASES = (
+    ('pre_departure', 'departure', -20 * 60, 10 * 60),
+    ('approach_landing', 'arrival', -30 * 60, 5 * 60),
+)
+# Analyzed frames per second inside critical windows and seconds between samples elsewhere
+DENSE_PHASE_FPS = float(os.environ.get('FATIGUE_PHASE_DENSE_FPS', 5.0))
+SPARSE_PHASE_INTERVAL = float(os.environ.get('FATIGUE_PHASE_SPARSE_INTERVAL', 10.0))
+SPARSE_PHASE_NAME = 'cruise'
+
+
+def build_phase_plan(departure_time: datetime, arrival_time: datetime, video_duration: float,
+                     fps: float, video_start: datetime = None) -> list:
+    """Split a flight recording into dense critical windows and sparse gaps.
+
+    Schedule times are mapped onto video time with video_start (default: the
+    recording starts at departure_time). Returns ordered, non-overlapping
+    segments covering the whole video: name, start, end (video seconds),
+    dense and frame_step (source frames between analyzed frames); empty when
+    the duration is unknown.
+    """
+    if not video_duration or video_duration <= 0:
+        logger.warning("Video duration is unknown, analyzing without flight phases")
+        return []
+    if video_start is None:
+        video_start = departure_time
+    anchors = {
+        'departure': (departure_time - video_start).total_seconds(),
+        'arrival': (arrival_time - video_start).total_seconds()
+    }
+    fps = fps or 30.0
+    dense_step = max(1, int(round(fps / DENSE_PHASE_FPS)))
+    sparse_step = max(dense_step, int(round(fps * SPARSE_PHASE_INTERVAL)))
+
+    windows = []
+    for name, anchor, before, after in CRITICAL_PHASES:
+        start = max(0.0, anchors[anchor] + before)
+        end = min(video_duration, anchors[anchor] + after)
+        if end > start:
+            windows.append((start, end, name))
+    windows.sort()
+
+    plan = []
+    position = 0.0
+    for start, end, name in windows:
+        # Overlapping windows (short flights): the later one starts where the earlier ends
+        start = max(start, position)
+        if end <= start:
+            continue
+        if start > position:
+            plan.append(_segment(SPARSE_PHASE_NAME, position, start, False, sparse_step))
+        plan.append(_segment(name, start, end, True, dense_step))
+        position = end
+    if position < video_duration:
+        name = 'post_arrival' if windows and windows[-1][2] == 'approach_landing' else SPARSE_PHASE_NAME
+        plan.append(_segment(name, position, video_duration, False, sparse_step))
+
+    if not any(segment['dense'] for segment in plan):
+        logger.warning(f"No critical flight phase falls inside the {video_duration:.0f}s recording")
+    return plan
+
+
+def _segment(name, start, end, dense, frame_step):
+    return {'name': name, 'start': round(start, 3), 'end': round(end, 3), 'dense': dense, 'frame_step': frame_step}
+
+
+def phase_index_at(plan: list, position: float) -> int:
+    """Index of the plan segment containing a video position"""
+    return max(0, bisect.bisect_right([segment['start'] for segment in plan], position) - 1)
+
+
+def expected_phase_frames(plan: list, fps: float) -> int:
+    """Frames the plan analyzes, for progress and ETA"""
+    fps = fps or 30.0
+    return sum(int((segment['end'] - segment['start']) * fps) // segment['frame_step'] for segment in plan)
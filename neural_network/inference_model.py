@@ -0,0 +1,173 @@
+import os
+import time
+import logging
+import argparse
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+logger = logging.getLogger(__name__)
+
+FACE_SIZE = (48, 48)
+# cv2.COLOR_BGR2GRAY weights in BGR channel order
+BGR_TO_GRAY_WEIGHTS = (0.114, 0.587, 0.299)
+
+# Batch sizes traced ahead of time by CompiledPredictor; other sizes are padded up
+COMPILED_BATCH_SIZES = (1, 2, 4, 8, 16, 32)
+# Set FATIGUE_JIT_COMPILE=1 to compile the traced graphs with XLA
+JIT_COMPILE_ENABLED = os.environ.get('FATIGUE_JIT_COMPILE', '0') == '1'
+
+
+def exported_model_path(model_path: str) -> str:
+    """Where the uint8 inference model for model_path is exported"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.uint8{ext}"
+
+
+def build_inference_model(model: tf.keras.Model) -> tf.keras.Model:
+    """Wrap a trained model so it accepts uint8 BGR 48x48 crops.
+
+    Normalization to [0, 1] and, for single-channel models, the BGR to gray
+    conversion become graph ops, so Python only resizes and batches crops.
+    """
+    inputs = tf.keras.Input(shape=(*FACE_SIZE, 3), dtype=tf.uint8, name='face_bgr_uint8')
+    x = tf.keras.layers.Rescaling(1.0 / 255.0, name='normalize')(inputs)
+
+    if model.input_shape[-1] == 1:
+        to_gray = tf.keras.layers.Conv2D(1, 1, use_bias=False, trainable=False, name='bgr_to_gray')
+        x = to_gray(x)
+        to_gray.set_weights([np.array(BGR_TO_GRAY_WEIGHTS, dtype=np.float32).reshape(1, 1, 3, 1)])
+
+    outputs = model(x)
+    return tf.keras.Model(inputs, outputs, name=f"{model.name}_uint8")
+
+
+class CompiledPredictor:
+    """Calls a Keras model through traced tf.function graphs instead of model.predict.
+
+    model.predict builds a data adapter and callbacks on every call, which
+    dominates the cost of scoring one face. Here one concrete function is
+    traced per batch size in COMPILED_BATCH_SIZES; a batch is zero-padded to
+    the next traced size (or split into chunks of the largest one), so no
+    retracing happens while serving. warmup() runs every traced size once.
+
+    Exposes predict_on_batch so it can stand in for the model in
+    BatchingInferenceService.
+    """
+
+    def __init__(self, model: tf.keras.Model, batch_sizes=COMPILED_BATCH_SIZES,
+                 jit_compile: bool = JIT_COMPILE_ENABLED):
+        self.model = model
+        self.input_shape = model.input_shape
+        self.batch_sizes = tuple(sorted(batch_sizes))
+        self.jit_compile = jit_compile
+        self._dtype = tf.as_dtype(model.inputs[0].dtype)
+
+        function = tf.function(lambda faces: model(faces, training=False), jit_compile=jit_compile)
+        self._functions = {
+            size: function.get_concrete_function(
+                tf.TensorSpec((size, *self.input_shape[1:]), self._dtype))
+            for size in self.batch_sizes
+        }
+
+    def warmup(self):
+        """Run each traced batch size once so the first real call is not slow"""
+        start_time = time.perf_counter()
+        for size, function in self._functions.items():
+            function(tf.zeros((size, *self.input_shape[1:]), self._dtype))
+        logger.info(f"Compiled inference warmed up for batch sizes {self.batch_sizes} "
+                    f"(jit_compile={self.jit_compile}) in {time.perf_counter() - start_time:.2f}s")
+
+    def _run(self, faces: np.ndarray) -> np.ndarray:
+        count = len(faces)
+        size = next(size for size in self.batch_sizes if size >= count)
+        if size > count:
+            padding = np.zeros((size - count, *faces.shape[1:]), dtype=faces.dtype)
+            faces = np.concatenate([faces, padding])
+        return self._functions[size](tf.constant(faces, self._dtype)).numpy()[:count]
+
+    def predict_on_batch(self, faces: np.ndarray) -> np.ndarray:
+        largest = self.batch_sizes[-1]
+        if len(faces) <= largest:
+            return self._run(faces)
+        return np.concatenate([self._run(faces[i:i + largest]) for i in range(0, len(faces), largest)])
+
+
+def benchmark_predict(model: tf.keras.Model, batch_size: int = 1, iterations: int = 200) -> dict:
+    """Mean per-call latency of model.predict vs CompiledPredictor for one batch size"""
+    faces = np.zeros((batch_size, *model.input_shape[1:]), dtype=tf.as_dtype(model.inputs[0].dtype).as_numpy_dtype)
+    predictor = CompiledPredictor(model)
+    predictor.warmup()
+    model.predict(faces, verbose=0)
+
+    timings = {}
+    for name, call in (('model_predict', lambda: model.predict(faces, verbose=0)),
+                       ('compiled', lambda: predictor.predict_on_batch(faces))):
+        start_time = time.perf_counter()
+        for _ in range(iterations):
+            call()
+        timings[f"{name}_ms"] = round((time.perf_counter() - start_time) / iterations * 1000, 3)
+    timings['batch_size'] = batch_size
+    timings['speedup'] = round(timings['model_predict_ms'] / timings['compiled_ms'], 1)
+    return timings
+
+
+def reference_preprocess(face: np.ndarray, channels: int) -> np.ndarray:
+    """The Python preprocessing used with the original model"""
+    face = cv2.resize(face, FACE_SIZE).astype(np.float32) / 255.0
+    if channels == 1:
+        face = np.expand_dims(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY), axis=-1)
+    return face
+
+
+def verify_inference_model(model: tf.keras.Model, inference_model: tf.keras.Model,
+                           samples: int = 64, seed: int = 0) -> float:
+    """Max absolute difference between both paths on random crops of random sizes"""
+    rng = np.random.default_rng(seed)
+    channels = model.input_shape[-1]
+    reference, fused = [], []
+    for _ in range(samples):
+        h, w = rng.integers(24, 160, size=2)
+        face = rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8)
+        reference.append(reference_preprocess(face, channels))
+        fused.append(cv2.resize(face, FACE_SIZE))
+
+    expected = model.predict(np.stack(reference), verbose=0)
+    actual = inference_model.predict(np.stack(fused), verbose=0)
+    return float(np.max(np.abs(expected - actual)))
+
+
+def export_inference_model(model_path: str, output_path: str = None, tolerance: float = 1e-5) -> str:
+    """Build, verify and save the uint8 inference model next to the original"""
+    output_path = output_path or exported_model_path(model_path)
+    model = tf.keras.models.load_model(model_path)
+    inference_model = build_inference_model(model)
+
+    max_diff = verify_inference_model(model, inference_model)
+    logger.info(f"uint8 inference model max abs difference: {max_diff:.2e}")
+    if max_diff > tolerance:
+        raise ValueError(f"Inference model differs from reference preprocessing by {max_diff:.2e}")
+
+    inference_model.save(output_path)
+    logger.info(f"Exported uint8 inference model to: {output_path}")
+    return output_path
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Export the fatigue model with preprocessing folded in')
+    parser.add_argument('--model', default=os.path.join('neural_network', 'data', 'models', 'fatigue_model.keras'))
+    parser.add_argument('--output', help='Output path (default: <model>.uint8.keras)')
+    parser.add_argument('--tolerance', type=float, default=1e-5)
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Compare model.predict and compiled inference latency instead of exporting')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        model = tf.keras.models.load_model(args.model)
+        for batch_size in (1, 4, 16):
+            print(benchmark_predict(model, batch_size))
+    else:
+        path = export_inference_model(args.model, args.output, args.tolerance)
+        print(f"Exported: {path}")
@@ -0,0 +1,160 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Set FATIGUE_BATCH_INFERENCE=1 to route all analyzers through the batching service
+BATCH_INFERENCE_ENABLED = os.environ.get('FATIGUE_BATCH_INFERENCE', '0') == '1'
+MAX_BATCH_SIZE = int(os.environ.get('FATIGUE_MAX_BATCH_SIZE', 32))
+MAX_BATCH_LATENCY_MS = float(os.environ.get('FATIGUE_MAX_BATCH_LATENCY_MS', 10))
+# Seconds predict() waits for a score before giving up on the service
+PREDICT_TIMEOUT = float(os.environ.get('FATIGUE_INFERENCE_TIMEOUT', 30))
+
+
+class BatchingInferenceService:
+    """Collects preprocessed face crops from concurrent analyzers into dynamic batches.
+
+    A single worker thread owns the model. It waits for the first crop, then
+    keeps collecting until the batch is full or max_latency_ms has passed since
+    that first crop, and runs one predict_on_batch call for the whole batch.
+    Callers get their score through a Future. Once closed, the service fails
+    every crop it did not score with RuntimeError.
+    """
+
+    def __init__(self, model, max_batch_size: int = MAX_BATCH_SIZE,
+                 max_latency_ms: float = MAX_BATCH_LATENCY_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()  # orders submit() against close(): no crop is queued after the sentinel
+
+        self.batches = 0
+        self.items = 0
+        self.inference_time = 0.0
+
+        self._thread = threading.Thread(target=self._run, name='fatigue-inference', daemon=True)
+        self._thread.start()
+
+    def submit(self, face: np.ndarray) -> Future:
+        """Queue one preprocessed crop (model input without the batch axis)"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Inference service is closed')
+            self._queue.put((face, future))
+        return future
+
+    def predict(self, face: np.ndarray, timeout: float = PREDICT_TIMEOUT) -> float:
+        try:
+            return self.submit(face).result(timeout=timeout)
+        except FutureTimeoutError:
+            raise RuntimeError(f'Inference service gave no score within {timeout}s')
+
+    def _collect_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.perf_counter() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # let the loop see the shutdown after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+
+            faces = np.stack([face for face, _ in batch])
+            futures = [future for _, future in batch]
+            start_time = time.perf_counter()
+            try:
+                predictions = np.asarray(self.model.predict_on_batch(faces)).reshape(len(batch), -1)[:, 0]
+            except Exception as e:
+                logger.error(f"Batched inference failed for {len(batch)} crops: {e}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.inference_time += time.perf_counter() - start_time
+            self.batches += 1
+            self.items += len(batch)
+            for future, prediction in zip(futures, predictions):
+                future.set_result(float(prediction))
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else 0,
+            'avg_batch_time': self.inference_time / self.batches if self.batches else 0
+        }
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout=5)
+
+        # Crops the worker did not reach (it died or is still stuck in a batch)
+        error = RuntimeError('Inference service is closed')
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(error)
+        if self._thread.is_alive():
+            self._queue.put(None)  # the drain took the sentinel
+
+
+_SERVICES = {}
+_SERVICES_LOCK = threading.Lock()
+
+
+def get_inference_service(model_path: str, model) -> BatchingInferenceService:
+    """Process-wide batching service for a model path, created on first use"""
+    with _SERVICES_LOCK:
+        service = _SERVICES.get(model_path)
+        if service is None:
+            logger.info(f"Starting batching inference service for {model_path} "
+                        f"(max batch {MAX_BATCH_SIZE}, max latency {MAX_BATCH_LATENCY_MS}ms)")
+            service = BatchingInferenceService(model)
+            _SERVICES[model_path] = service
+        return service
+
+
+def release_inference_services(key_prefix: str):
+    """Stop the services of a retired model version (keys starting with key_prefix).
+
+    Queued crops are still scored; analyzers that keep a reference to a closed
+    service fall back to scoring directly (FatigueAnalyzer._predict).
+    """
+    with _SERVICES_LOCK:
+        released = [key for key in _SERVICES if key.startswith(key_prefix)]
+        services = [_SERVICES.pop(key) for key in released]
+    for key, service in zip(released, services):
+        logger.info(f"Stopping batching inference service for retired {key}")
+        service.close()
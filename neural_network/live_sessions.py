@@ -0,0 +1,219 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+from neural_network.predict import FatigueAnalyzer
+from neural_network.cpu_budget import THREAD_BUDGET
+from neural_network.model_registry import get_model_registry
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join('neural_network', 'data', 'models', 'fatigue_model.keras')
+
+MAX_LIVE_SESSIONS = int(os.environ.get('FATIGUE_MAX_LIVE_SESSIONS', 64))
+LIVE_WORKERS = THREAD_BUDGET['live_workers']  # FATIGUE_LIVE_WORKERS overrides the budget
+# Sessions without frames for this long are closed
+SESSION_IDLE_TIMEOUT = 60
+# Upper bound for one encoded frame
+MAX_FRAME_BYTES = 2 * 1024 * 1024
+# Seconds a frame waits for a free analyzer before the request fails
+ANALYZER_WAIT_TIMEOUT = 30
+
+
+class LiveSessionError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LiveSession:
+    """Smoothing state of one live stream; no models or frames are kept here"""
+
+    def __init__(self, session_id: str, employee_id: int):
+        self.session_id = session_id
+        self.employee_id = employee_id
+        self.state = None  # FatigueAnalyzer.get_state() snapshot
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+        self.frames_received = 0
+        self.frames_rejected = 0
+        self.lock = threading.Lock()
+
+
+class LiveSessionManager:
+    """Serves many live streams from a small pool of analyzers.
+
+    All analyzers share the process-wide Keras model; each one owns a MediaPipe
+    detector. A frame borrows an analyzer, loads the session's state into it,
+    processes the frame and stores the state back, so memory is bounded by the
+    pool size plus a few hundred bytes per session.
+    """
+
+    def __init__(self, model_path: str = MODEL_PATH, max_sessions: int = MAX_LIVE_SESSIONS,
+                 workers: int = LIVE_WORKERS, idle_timeout: float = SESSION_IDLE_TIMEOUT):
+        self.model_path = model_path
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+
+        self.workers = workers
+        self._pool = queue.Queue()
+        self._pool_size = 0
+        self._pool_lock = threading.Lock()
+
+    def _new_analyzer(self) -> FatigueAnalyzer:
+        """Analyzer for a slot already counted in _pool_size; the slot is given back if this fails"""
+        try:
+            return FatigueAnalyzer(self.model_path)
+        except Exception:
+            with self._pool_lock:
+                self._pool_size -= 1
+            raise
+
+    def _acquire_analyzer(self) -> FatigueAnalyzer:
+        try:
+            analyzer = self._pool.get_nowait()
+        except queue.Empty:
+            analyzer = None
+            with self._pool_lock:
+                grow = self._pool_size < self.workers
+                if grow:
+                    self._pool_size += 1
+            if grow:
+                return self._new_analyzer()
+        if analyzer is None:
+            try:
+                analyzer = self._pool.get(timeout=ANALYZER_WAIT_TIMEOUT)
+            except queue.Empty:
+                raise LiveSessionError('All live analyzers are busy', 503)
+
+        # Pooled analyzers outlive model swaps: replace ones built on an older version
+        if analyzer.model_version != get_model_registry(self.model_path).active().version:
+            analyzer.close()
+            analyzer = self._new_analyzer()
+        return analyzer
+
+    def _release_analyzer(self, analyzer: FatigueAnalyzer):
+        self._pool.put(analyzer)
+
+    def _evict_idle(self, now: float):
+        expired = [sid for sid, session in self.sessions.items()
+                   if now - session.last_seen > self.idle_timeout]
+        for sid in expired:
+            logger.info(f"Closing idle live session {sid}")
+            del self.sessions[sid]
+
+    def open_session(self, employee_id: int) -> LiveSession:
+        now = time.time()
+        with self.sessions_lock:
+            self._evict_idle(now)
+            if len(self.sessions) >= self.max_sessions:
+                raise LiveSessionError('Too many live sessions', 503)
+            session = LiveSession(uuid.uuid4().hex, employee_id)
+            self.sessions[session.session_id] = session
+        logger.info(f"Opened live session {session.session_id} for employee {employee_id}")
+        return session
+
+    def get_session(self, session_id: str, employee_id: int) -> LiveSession:
+        with self.sessions_lock:
+            session = self.sessions.get(session_id)
+        if session is None or session.employee_id != employee_id:
+            raise LiveSessionError('Live session not found', 404)
+        return session
+
+    def process_frame(self, session_id: str, employee_id: int, data: bytes) -> dict:
+        """Decode an encoded (JPEG/PNG) frame and return the session's smoothed score"""
+        start_time = time.perf_counter()
+        session = self.get_session(session_id, employee_id)
+
+        if not data or len(data) > MAX_FRAME_BYTES:
+            session.frames_rejected += 1
+            raise LiveSessionError('Frame is empty or too large', 413 if data else 400)
+
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            session.frames_rejected += 1
+            raise LiveSessionError('Frame could not be decoded')
+
+        # Frames of one session are processed in order
+        with session.lock:
+            analyzer = self._acquire_analyzer()
+            try:
+                if session.state is None:
+                    analyzer.reset()
+                else:
+                    analyzer.set_state(session.state)
+                faces_before = analyzer.face_detected_frames
+                analyzer.process_frame(frame)
+                session.state = analyzer.get_state()
+            finally:
+                self._release_analyzer(analyzer)
+
+            session.frames_received += 1
+            session.last_seen = time.time()
+            state = session.state
+
+        smoothed = float(np.mean(state['buffer'])) if state['buffer'] else None
+        return {
+            'session_id': session_id,
+            'frame': session.frames_received,
+            'face_detected': state['face_detected_frames'] > faces_before,
+            'score': round(smoothed, 3) if smoothed is not None else None,
+            'face_detection_rate': state['face_detected_frames'] / state['total_frames'],
+            'latency_ms': round((time.perf_counter() - start_time) * 1000, 2)
+        }
+
+    def close_session(self, session_id: str, employee_id: int) -> dict:
+        """Remove the session and return its final score"""
+        session = self.get_session(session_id, employee_id)
+        with self.sessions_lock:
+            self.sessions.pop(session_id, None)
+
+        with session.lock:
+            if session.state is None:
+                result = {'level': 'No data', 'score': 0.0, 'percent': 0.0,
+                          'face_detection_rate': 0, 'avg_processing_time': 0}
+            else:
+                analyzer = self._acquire_analyzer()
+                try:
+                    analyzer.set_state(session.state)
+                    result = analyzer.get_final_score()
+                finally:
+                    self._release_analyzer(analyzer)
+
+        result['session_id'] = session_id
+        result['frames_received'] = session.frames_received
+        result['frames_rejected'] = session.frames_rejected
+        result['duration_seconds'] = round(time.time() - session.created_at, 1)
+        logger.info(f"Closed live session {session_id}: {result}")
+        return result
+
+    def stats(self) -> dict:
+        with self.sessions_lock:
+            active = len(self.sessions)
+        return {
+            'active_sessions': active,
+            'max_sessions': self.max_sessions,
+            'analyzers': self._pool_size,
+            'idle_analyzers': self._pool.qsize()
+        }
+
+
+_MANAGER = None
+_MANAGER_LOCK = threading.Lock()
+
+
+def get_session_manager() -> LiveSessionManager:
+    """Process-wide live session manager, created on first use"""
+    global _MANAGER
+    with _MANAGER_LOCK:
+        if _MANAGER is None:
+            _MANAGER = LiveSessionManager()
+        return _MANAGER
@@ -0,0 +1,55 @@
+import os
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FILE = 'neural_network_analysis.log'
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_LEVEL = os.environ.get('FATIGUE_LOG_LEVEL', 'INFO')
+
+_listener = None
+_queue_handler = None
+
+
+def _start_listener(log_file: str):
+    """Queue plus the listener thread that writes its records, for the current process"""
+    global _listener
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return log_queue
+
+
+def setup_logging(level: str = LOG_LEVEL, log_file: str = LOG_FILE):
+    """Route root logging through a queue; file and console writes happen on a listener thread.
+
+    Analysis threads only enqueue records, so a slow disk or console never
+    stalls frame processing. Safe to call more than once. Threads do not
+    survive fork(), so a forked child (gunicorn preload) starts its own
+    listener and queue.
+    """
+    global _queue_handler
+    if _listener is not None:
+        return
+
+    _queue_handler = QueueHandler(_start_listener(log_file))
+    atexit.register(lambda: _listener.stop())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_queue_handler)
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: _restart_in_child(log_file))
+
+
+def _restart_in_child(log_file: str):
+    # The inherited listener thread is gone: point the root handler at a fresh queue
+    _queue_handler.queue = _start_listener(log_file)
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join('neural_network', 'data', 'models', 'fatigue_model.keras')
+# Poll the model file every N seconds and hot swap when its content changes (0 = off)
+MODEL_WATCH_INTERVAL = float(os.environ.get('FATIGUE_MODEL_WATCH_INTERVAL', 0))
+
+# Seconds between checks of the shared active-version marker (see ModelRegistry)
+MARKER_CHECK_INTERVAL = float(os.environ.get('FATIGUE_MODEL_MARKER_INTERVAL', 2))
+
+# Called with the cache key of a version that is no longer kept loaded, so
+# derived objects (uint8 wrappers, compiled predictors) can be dropped too
+RETIRE_HOOKS = []
+
+
+def file_version(model_path: str) -> str:
+    """Content hash of a model file, used as its version"""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class ModelVersion:
+    """One loaded and warmed model"""
+
+    def __init__(self, version: str, model_path: str, model):
+        self.version = version
+        self.model_path = model_path
+        self.model = model
+        self.loaded_at = time.time()
+
+    @property
+    def key(self) -> str:
+        """Cache key for everything derived from this version"""
+        return f"{self.model_path}@{self.version}"
+
+    def to_dict(self) -> dict:
+        return {'version': self.version, 'model_path': self.model_path, 'loaded_at': self.loaded_at}
+
+
+class ModelRegistry:
+    """Active model version for one model path, switchable without a restart.
+
+    activate() loads and warms a model file off the request path and then
+    swaps it in under a lock. Analyzers take the active version when they are
+    constructed and keep a reference to it, so analyses already running finish
+    on the old version while new ones use the new one. The previous version
+    stays loaded for an instant rollback(); older ones are released.
+
+    activate() and rollback() also record the chosen file and version in a
+    marker file next to the model (<model>.active.json). Every process
+    checks the marker every MARKER_CHECK_INTERVAL seconds and follows it, so
+    a switch made through one gunicorn worker reaches all of them.
+    """
+
+    def __init__(self, model_path: str = MODEL_PATH):
+        self.model_path = model_path
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._active = None
+        self._previous = None
+        self._loading = None
+        self._last_error = None
+        self._watch_mtime = None
+        self.marker_path = f"{model_path}.active.json"
+        self._marker_mtime = None
+        self._marker_checked = 0.0
+
+    def _read_marker(self):
+        try:
+            with open(self.marker_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _publish(self, loaded: ModelVersion):
+        """Record the active version for the other processes"""
+        tmp_path = f"{self.marker_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'model_path': loaded.model_path, 'version': loaded.version,
+                           'updated_at': time.time(), 'pid': os.getpid()}, f)
+            os.replace(tmp_path, self.marker_path)
+            self._marker_mtime = os.path.getmtime(self.marker_path)
+        except OSError as e:
+            logger.error(f"Failed to write model marker {self.marker_path}: {e}")
+
+    def _sync_marker(self):
+        """Follow a switch published by another process"""
+        now = time.monotonic()
+        if now - self._marker_checked < MARKER_CHECK_INTERVAL:
+            return
+        self._marker_checked = now
+        try:
+            mtime = os.path.getmtime(self.marker_path)
+        except OSError:
+            return
+        if mtime == self._marker_mtime:
+            return
+
+        marker = self._read_marker()
+        with self._lock:
+            active, previous = self._active, self._previous
+        if active is None or self._loading:
+            return  # a load is in progress: check the marker again once it is done
+        target = (marker['model_path'], marker['version']) if marker else None
+        if target is None or (active.model_path, active.version) == target:
+            self._marker_mtime = mtime
+            return
+        logger.info(f"Following model switch by process {marker.get('pid')}: {target}")
+        if previous is not None and (previous.model_path, previous.version) == target:
+            self.rollback(publish=False)
+            self._marker_mtime = mtime
+        else:
+            self._follow(marker['model_path'], mtime)
+
+    def _follow(self, model_path: str, mtime: float):
+        """Activate a published model in the background; the marker counts as seen once that is done"""
+        def load_and_switch():
+            try:
+                self.activate(model_path, background=False, publish=False)
+            except Exception:
+                pass  # logged and kept in last_error by activate(); not retried until the marker changes
+            self._marker_mtime = mtime
+
+        threading.Thread(target=load_and_switch, name='model-follow', daemon=True).start()
+
+    def _load(self, model_path: str) -> ModelVersion:
+        version = file_version(model_path)
+        with self._lock:
+            for loaded in (self._active, self._previous):
+                if loaded is not None and loaded.model_path == model_path and loaded.version == version:
+                    return loaded
+
+        start_time = time.perf_counter()
+        logger.info(f"Loading model version {version} from: {model_path}")
+        model = tf.keras.models.load_model(model_path)
+        logger.info(f"Model input shape: {model.input_shape}, output shape: {model.output_shape}")
+
+        # Warm up so the first analysis on this version does not pay for graph building
+        dtype = tf.as_dtype(model.inputs[0].dtype).as_numpy_dtype
+        model.predict(np.zeros((1, *model.input_shape[1:]), dtype=dtype), verbose=0)
+        logger.info(f"Model version {version} loaded and warmed in {time.perf_counter() - start_time:.2f}s")
+        return ModelVersion(version, model_path, model)
+
+    def _switch(self, loaded: ModelVersion):
+        retired = None
+        with self._lock:
+            if self._active is loaded:
+                return
+            if self._previous is not None and self._previous is not loaded:
+                retired = self._previous
+            self._previous = self._active
+            self._active = loaded
+        logger.info(f"Active model version: {loaded.version} ({loaded.model_path})")
+
+        if retired is not None:
+            for hook in RETIRE_HOOKS:
+                hook(retired.key)
+
+    def active(self) -> ModelVersion:
+        """Version new analyses should use; loads the model file on first use"""
+        with self._lock:
+            loaded = self._active
+        if loaded is not None:
+            self._sync_marker()
+            return loaded
+        with self._load_lock:
+            if self._active is None:
+                # Start on the version other processes switched to, if any
+                marker = self._read_marker()
+                model_path = self.model_path
+                if marker and os.path.exists(marker['model_path']):
+                    model_path = marker['model_path']
+                    if os.path.exists(self.marker_path):
+                        self._marker_mtime = os.path.getmtime(self.marker_path)
+                self._switch(self._load(model_path))
+            return self._active
+
+    def activate(self, model_path: str = None, background: bool = True, publish: bool = True):
+        """Load, warm and switch to a model file (default: the registry's own path).
+
+        publish=False switches this process only (used when following the marker).
+        """
+        model_path = model_path or self.model_path
+
+        def load_and_switch():
+            with self._load_lock:
+                self._loading = model_path
+                try:
+                    loaded = self._load(model_path)
+                    self._switch(loaded)
+                    if publish:
+                        self._publish(loaded)
+                    self._last_error = None
+                except Exception as e:
+                    logger.error(f"Failed to activate model {model_path}: {e}")
+                    self._last_error = str(e)
+                    if not background:
+                        raise
+                finally:
+                    self._loading = None
+
+        if background:
+            threading.Thread(target=load_and_switch, name='model-activate', daemon=True).start()
+        else:
+            load_and_switch()
+
+    def rollback(self, publish: bool = True) -> ModelVersion:
+        """Switch back to the previously active version"""
+        with self._lock:
+            if self._previous is None:
+                raise ValueError('No previous model version to roll back to')
+            self._active, self._previous = self._previous, self._active
+            loaded = self._active
+        logger.info(f"Rolled back to model version: {loaded.version}")
+        if publish:
+            self._publish(loaded)
+        return loaded
+
+    def status(self) -> dict:
+        self._sync_marker()
+        with self._lock:
+            return {
+                'active': self._active.to_dict() if self._active else None,
+                'previous': self._previous.to_dict() if self._previous else None,
+                'loading': self._loading,
+                'last_error': self._last_error,
+                'marker': self._read_marker()
+            }
+
+    def watch(self, interval: float = MODEL_WATCH_INTERVAL):
+        """Activate the model file again whenever its modification time changes"""
+        if os.path.exists(self.model_path):
+            self._watch_mtime = os.path.getmtime(self.model_path)
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    mtime = os.path.getmtime(self.model_path)
+                except OSError:
+                    continue
+                if mtime != self._watch_mtime:
+                    self._watch_mtime = mtime
+                    logger.info(f"Model file changed: {self.model_path}")
+                    try:
+                        self.activate(self.model_path, background=False)
+                    except Exception:
+                        pass  # logged by activate, the active version stays in place
+
+        threading.Thread(target=poll, name='model-watch', daemon=True).start()
+
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_model_registry(model_path: str = MODEL_PATH) -> ModelRegistry:
+    """Process-wide registry for a model path, created on first use"""
+    model_path = os.path.normpath(model_path)
+    with _REGISTRIES_LOCK:
+        registry = _REGISTRIES.get(model_path)
+        if registry is None:
+            registry = ModelRegistry(model_path)
+            if MODEL_WATCH_INTERVAL > 0:
+                registry.watch()
+            _REGISTRIES[model_path] = registry
+        return registry
@@ -8,25 +8,127 @@ import os
 from pathlib import Path
 import logging
 import argparse
+import json
+import csv
+import hashlib
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Configure detailed logging
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('neural_network_analysis.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from neural_network.video_probe import probe_video, check_video_limits, choose_analysis_strategy
+from neural_network.ffmpeg_source import FFmpegFrameSource
+from neural_network.inference_service import BATCH_INFERENCE_ENABLED, get_inference_service, release_inference_services
+from neural_network.capture import LatestFrameCapture, ReplayCapture, VIDEO_EXTENSIONS
+from neural_network.cpu_budget import configure_threads, THREAD_BUDGET
+from neural_network.inference_model import build_inference_model, exported_model_path, CompiledPredictor
+from neural_network.model_registry import get_model_registry, RETIRE_HOOKS
+from neural_network.shadow import start_shadow_run
+from neural_network.profiling import StageTimer
+from neural_network.logging_setup import setup_logging
+from neural_network.flight_phases import phase_index_at, expected_phase_frames
+from neural_network.checkpoint import (AnalysisCheckpoint, default_checkpoint_key, concat_segments,
+                                       CHECKPOINT_INTERVAL, LONG_VIDEO_THRESHOLD)
+
+# Handlers are installed by the entry point (setup_logging in logging_setup.py), not on import
 logger = logging.getLogger(__name__)
 
+# With DEBUG logging on, per-frame diagnostics are written for every Nth frame only
+DEBUG_LOG_INTERVAL = max(1, int(os.environ.get('FATIGUE_DEBUG_LOG_INTERVAL', 1)))
+
 # MediaPipe инициализация с более мягкими настройками
 mp_face_detection = mp.solutions.face_detection
+mp_face_mesh = mp.solutions.face_mesh
 mp_drawing = mp.solutions.drawing_utils
 
+# Cheap-first cascade: eye aspect ratio (EAR) from Face Mesh landmarks gates the CNN
+CASCADE_ENABLED = os.environ.get('FATIGUE_CASCADE', '0') == '1'
+EAR_OPEN = 0.27  # eyes clearly open at or above this EAR
+EAR_CLOSED = 0.15  # eyes clearly closed at or below this EAR
+CASCADE_SAMPLE_INTERVAL = 10  # every Nth confidently scored face still runs the CNN
+LEFT_EYE_LANDMARKS = (362, 385, 387, 263, 373, 380)
+RIGHT_EYE_LANDMARKS = (33, 160, 158, 133, 153, 144)
+
+# Near-duplicate skipping: reuse the previous score when the face crop barely changed
+SKIP_DUPLICATES_ENABLED = os.environ.get('FATIGUE_SKIP_DUPLICATES', '0') == '1'
+DUPLICATE_SIGNATURE_SIZE = 16  # crops are compared as 16x16 grayscale thumbnails
+DUPLICATE_THRESHOLD = 3.0  # mean absolute difference in gray levels (0-255)
+MAX_DUPLICATE_REUSE = 30  # force a fresh score after this many reuses in a row
+
+# Normalization and gray conversion inside the model graph; the analyzer feeds uint8 crops
+FUSED_PREPROCESSING_ENABLED = os.environ.get('FATIGUE_FUSED_PREPROCESSING', '0') == '1'
+
+# Score faces through traced tf.function graphs instead of model.predict
+COMPILED_INFERENCE_ENABLED = os.environ.get('FATIGUE_COMPILED_INFERENCE', '0') == '1'
+
+# Frame source for video files: 'opencv' (cv2.VideoCapture) or 'ffmpeg' (pipe decoder)
+DEFAULT_DECODER = os.environ.get('FATIGUE_DECODER', 'opencv')
+# Gaps between sampled frames at least this long (seconds) are seeked over by the ffmpeg decoder
+FFMPEG_SEEK_MIN_GAP = 2.0
+
+# Minimum interval between progress_callback calls in analyze_source (seconds)
+PROGRESS_INTERVAL = 0.5
+
+# Stage timer samples kept per stage in long-video mode
+LONG_VIDEO_TIMER_SAMPLES = 10000
+
+# Number of frames sampled for a provisional (preview) score
+PREVIEW_SAMPLE_COUNT = 24
+
 # Global analyzer instance for reuse
 _GLOBAL_ANALYZER = None
 
+# Models derived from registry versions (uint8 wrappers, compiled predictors), by version key
+_MODEL_CACHE = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+
+def _retire_model_version(version_key: str):
+    with _MODEL_CACHE_LOCK:
+        for cache_key in [key for key in _MODEL_CACHE if key.startswith(version_key)]:
+            del _MODEL_CACHE[cache_key]
+    release_inference_services(version_key)
+
+RETIRE_HOOKS.append(_retire_model_version)
+
+def load_shared_model(model_path: str):
+    """Active version of a model, loaded once per process (see model_registry.py)"""
+    return get_model_registry(model_path).active().model
+
+def load_shared_inference_model(model_version):
+    """uint8-input variant of a registry model version (see inference_model.py).
+
+    Uses the exported <model>.uint8.keras if it is newer than the model file,
+    otherwise wraps the base model.
+    """
+    cache_key = f"{model_version.key}#uint8"
+    with _MODEL_CACHE_LOCK:
+        model = _MODEL_CACHE.get(cache_key)
+    if model is not None:
+        return model
+    
+    model_path = model_version.model_path
+    exported_path = exported_model_path(model_path)
+    if os.path.exists(exported_path) and os.path.getmtime(exported_path) >= os.path.getmtime(model_path):
+        logger.info(f"Loading uint8 inference model from: {exported_path}")
+        model = tf.keras.models.load_model(exported_path)
+    else:
+        model = build_inference_model(model_version.model)
+        logger.info(f"Built uint8 inference model from: {model_path}")
+    
+    with _MODEL_CACHE_LOCK:
+        return _MODEL_CACHE.setdefault(cache_key, model)
+
+def load_shared_predictor(cache_key: str, model) -> CompiledPredictor:
+    """Compiled predictor for a loaded model, traced and warmed up once per process"""
+    cache_key = f"{cache_key}#compiled"
+    with _MODEL_CACHE_LOCK:
+        predictor = _MODEL_CACHE.get(cache_key)
+        if predictor is None:
+            predictor = CompiledPredictor(model)
+            predictor.warmup()
+            _MODEL_CACHE[cache_key] = predictor
+        return predictor
+
 def get_analyzer():
     """Returns the global analyzer instance, creating it if necessary"""
     global _GLOBAL_ANALYZER
@@ -39,17 +141,58 @@ def get_analyzer():
         _GLOBAL_ANALYZER = FatigueAnalyzer(model_path)
     return _GLOBAL_ANALYZER
 
+def score_level(score: float) -> str:
+    """Fatigue level for a 0-1 score"""
+    if score < 0.3:
+        return "Low"
+    if score < 0.7:
+        return "Medium"
+    return "High"
+
 class FatigueAnalyzer:
-    def __init__(self, model_path: str, buffer_size: int = 15):
+    def __init__(self, model_path: str, buffer_size: int = 15, use_batching: bool = None,
+                 cascade: bool = None, skip_duplicates: bool = None, fused_preprocessing: bool = None,
+                 compiled: bool = None):
         logger.info(f"Initializing FatigueAnalyzer with model: {model_path}")
+        # TF/OpenCV thread pools sized from the shared CPU budget (first analyzer only)
+        configure_threads()
+        if fused_preprocessing is None:
+            fused_preprocessing = FUSED_PREPROCESSING_ENABLED
+        self.fused_preprocessing = fused_preprocessing
         try:
-            self.model = tf.keras.models.load_model(model_path)
-            logger.info("Model loaded successfully")
-            logger.info(f"Model input shape: {self.model.input_shape}")
-            logger.info(f"Model output shape: {self.model.output_shape}")
+            # Version active right now; this analyzer keeps it even if a newer one is activated
+            model_version = get_model_registry(model_path).active()
+            if fused_preprocessing:
+                self.model = load_shared_inference_model(model_version)
+            else:
+                self.model = model_version.model
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             raise
+        self.model_version = model_version.version
+        
+        # Decided once instead of inspecting input_shape for every face
+        expected_shape = self.model.input_shape
+        self.expects_grayscale = (not fused_preprocessing
+                                  and len(expected_shape) == 4 and expected_shape[-1] == 1)
+        
+        model_key = f"{model_version.key}#uint8" if fused_preprocessing else model_version.key
+        
+        # Traced tf.function inference, warmed up here rather than on the first face
+        if compiled is None:
+            compiled = COMPILED_INFERENCE_ENABLED
+        self.predictor = load_shared_predictor(model_key, self.model) if compiled else None
+        
+        # Cross-analyzer dynamic batching (see inference_service.py)
+        if use_batching is None:
+            use_batching = BATCH_INFERENCE_ENABLED
+        if use_batching:
+            if compiled:
+                self.inference_service = get_inference_service(f"{model_key}#compiled", self.predictor)
+            else:
+                self.inference_service = get_inference_service(model_key, self.model)
+        else:
+            self.inference_service = None
             
         self.buffer = []
         self.buffer_size = buffer_size
@@ -64,36 +207,105 @@ class FatigueAnalyzer:
         except Exception as e:
             logger.error(f"Failed to initialize MediaPipe: {e}")
             raise
+        
+        if cascade is None:
+            cascade = CASCADE_ENABLED
+        self.face_mesh = None
+        if cascade:
+            self.face_mesh = mp_face_mesh.FaceMesh(
+                static_image_mode=False,
+                max_num_faces=1,
+                min_detection_confidence=0.5
+            )
+            logger.info("Cascade enabled: Face Mesh eye-closure estimator gates the CNN")
+        
+        if skip_duplicates is None:
+            skip_duplicates = SKIP_DUPLICATES_ENABLED
+        self.skip_duplicates = skip_duplicates
+        
+        # Inference counters (per analyzer, not per stream)
+        self.skipped_inferences = 0
+        self.cnn_calls = 0
+        self.cascade_confident = 0
+        self.cascade_samples = 0
+        self.cascade_agreements = 0
+        self.cascade_abs_error = 0.0
+        
+        # Set by analyze_source when shadow mode samples the analysis (see shadow.py)
+        self.shadow_run = None
+        
+        # Per-stage frame timings (color, detect, gating, preprocess, inference, draw)
+        self.timer = StageTimer()
+        
+        # Called with every score added to the buffer (per-phase scoring in analyze_source)
+        self.score_listener = None
             
+        self.reset()
+
+    def reset(self):
+        """Clear smoothing buffer and counters (models and detector are kept)"""
+        self.buffer = []
         self.last_face_time = time.time()
         self.face_detected_frames = 0
         self.total_frames = 0
         self.processing_times = []
+        self.last_signature = None
+        self.last_prediction = None
+        self.duplicate_reuses = 0
+
+    def get_state(self) -> dict:
+        """Per-stream state, so one analyzer can serve several streams in turn"""
+        return {
+            'buffer': list(self.buffer),
+            'last_face_time': self.last_face_time,
+            'face_detected_frames': self.face_detected_frames,
+            'total_frames': self.total_frames,
+            'processing_times': list(self.processing_times),
+            'last_signature': self.last_signature,
+            'last_prediction': self.last_prediction,
+            'duplicate_reuses': self.duplicate_reuses
+        }
+
+    def set_state(self, state: dict):
+        self.buffer = list(state['buffer'])
+        self.last_face_time = state['last_face_time']
+        self.face_detected_frames = state['face_detected_frames']
+        self.total_frames = state['total_frames']
+        self.processing_times = list(state['processing_times'])
+        self.last_signature = state.get('last_signature')
+        self.last_prediction = state.get('last_prediction')
+        self.duplicate_reuses = state.get('duplicate_reuses', 0)
 
     def process_frame(self, frame: np.ndarray, show_visualization: bool = False) -> np.ndarray:
         """Process frame with improved face detection"""
         start_time = time.time()
+        self.timer.start()
         self.total_frames += 1
         
-        logger.debug(f"Processing frame {self.total_frames}, shape: {frame.shape}")
+        # Checked once per frame; nothing below is formatted or computed when DEBUG is off
+        debug = self.total_frames % DEBUG_LOG_INTERVAL == 0 and logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Processing frame %d, shape: %s", self.total_frames, frame.shape)
         
         # Convert BGR to RGB for MediaPipe (OpenCV uses BGR by default)
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        self.timer.mark('color')
         
         try:
             # Process with MediaPipe
             results = self.face_detection.process(rgb_frame)
-            logger.debug(f"MediaPipe processing completed for frame {self.total_frames}")
         except Exception as e:
-            logger.error(f"Face detection error on frame {self.total_frames}: {e}")
+            logger.error("Face detection error on frame %d: %s", self.total_frames, e)
             return frame
+        self.timer.mark('detect')
         
         # Check if faces were detected
         if results.detections:
             self.last_face_time = time.time()
             self.face_detected_frames += 1
             
-            logger.debug(f"Face detected in frame {self.total_frames}, detections: {len(results.detections)}")
+            if debug:
+                logger.debug("Face detected in frame %d, detections: %d", self.total_frames, len(results.detections))
             
             for detection in results.detections:
                 try:
@@ -106,23 +318,25 @@ class FatigueAnalyzer:
                     width = min(w - x, int(bbox.width * w))
                     height = min(h - y, int(bbox.height * h))
                     
-                    logger.debug(f"Face bbox: x={x}, y={y}, w={width}, h={height}")
+                    if debug:
+                        logger.debug("Face bbox: x=%d, y=%d, w=%d, h=%d", x, y, width, height)
 
                     if width > 20 and height > 20:  # Минимальный размер лица
                         try:
                             # Извлекаем область лица
                             face_roi = frame[y:y+height, x:x+width]
-                            logger.debug(f"Face ROI shape: {face_roi.shape}")
-                            
-                            # Предобработка для модели (как при обучении)
-                            processed = self._preprocess_face(face_roi)
-                            logger.debug(f"Processed face shape: {processed.shape}")
                             
-                            # Предсказание модели
-                            prediction = self.model.predict(processed[None, ...], verbose=0)[0][0]
+                            # Оценка усталости (каскад или сразу CNN)
+                            cnn_calls = self.cnn_calls
+                            prediction = self._score_face(face_roi, rgb_frame[y:y+height, x:x+width])
                             self._update_buffer(prediction)
+                            if self.cnn_calls == cnn_calls:
+                                # Scored without the CNN; otherwise _cnn_score already marked gating
+                                self.timer.mark('gating')
                             
-                            logger.debug(f"Fatigue prediction: {prediction:.3f}, buffer avg: {np.mean(self.buffer):.3f}")
+                            if debug:
+                                logger.debug("Fatigue prediction: %.3f, buffer avg: %.3f",
+                                             prediction, np.mean(self.buffer))
                             
                             # Визуализация
                             if show_visualization:
@@ -140,20 +354,23 @@ class FatigueAnalyzer:
                                 confidence = detection.score[0] if detection.score else 0
                                 cv2.putText(frame, f"Conf: {confidence:.2f}", 
                                            (x, y+height+20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+                                self.timer.mark('draw')
                                 
                         except Exception as e:
-                            logger.error(f"Processing error for detection: {str(e)}")
+                            logger.error("Processing error for detection: %s", e)
                             continue
                         
                 except Exception as e:
-                    logger.error(f"Detection processing error: {str(e)}")
+                    logger.error("Detection processing error: %s", e)
                     continue
         else:
-            logger.debug(f"No face detected in frame {self.total_frames}")
+            if debug:
+                logger.debug("No face detected in frame %d", self.total_frames)
             # Если долго нет лица, добавляем штрафной балл
             if time.time() - self.last_face_time > 2:
-                self.buffer.append(1.0)
-                logger.debug(f"No face detected for >2s, adding penalty score")
+                self._update_buffer(1.0)
+                if debug:
+                    logger.debug("No face detected for >2s, adding penalty score")
         
         processing_time = time.time() - start_time
         self.processing_times.append(processing_time)
@@ -163,34 +380,142 @@ class FatigueAnalyzer:
         
         return frame
 
+    def _score_face(self, face_roi: np.ndarray, rgb_roi: np.ndarray) -> float:
+        """Fatigue score for a face, reusing the last score for near-duplicate crops"""
+        if not self.skip_duplicates:
+            return self._score_new_face(face_roi, rgb_roi)
+        
+        gray = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY)
+        signature = cv2.resize(gray, (DUPLICATE_SIGNATURE_SIZE, DUPLICATE_SIGNATURE_SIZE),
+                               interpolation=cv2.INTER_AREA).astype(np.float32)
+        
+        if (self.last_signature is not None and self.last_prediction is not None
+                and self.duplicate_reuses < MAX_DUPLICATE_REUSE
+                and float(np.mean(np.abs(signature - self.last_signature))) < DUPLICATE_THRESHOLD):
+            self.skipped_inferences += 1
+            self.duplicate_reuses += 1
+            return self.last_prediction
+        
+        prediction = self._score_new_face(face_roi, rgb_roi)
+        self.last_signature = signature
+        self.last_prediction = prediction
+        self.duplicate_reuses = 0
+        return prediction
+
+    def _score_new_face(self, face_roi: np.ndarray, rgb_roi: np.ndarray) -> float:
+        """Fatigue score for a face, trying the cheap eye-closure estimator first"""
+        if self.face_mesh is not None:
+            ear = self._eye_aspect_ratio(rgb_roi)
+            if ear is not None and (ear >= EAR_OPEN or ear <= EAR_CLOSED):
+                cheap_score = float(np.clip((EAR_OPEN - ear) / (EAR_OPEN - EAR_CLOSED), 0.0, 1.0))
+                self.cascade_confident += 1
+                if self.cascade_confident % CASCADE_SAMPLE_INTERVAL:
+                    return cheap_score
+                
+                # Periodic sample: run the CNN too and track agreement with the estimator
+                prediction = self._cnn_score(face_roi)
+                self.cascade_samples += 1
+                self.cascade_agreements += int((cheap_score > 0.5) == (prediction > 0.5))
+                self.cascade_abs_error += abs(cheap_score - prediction)
+                return prediction
+        
+        return self._cnn_score(face_roi)
+
+    def _cnn_score(self, face_roi: np.ndarray) -> float:
+        # Bbox, duplicate check and cascade so far
+        self.timer.mark('gating')
+        
+        # Предобработка для модели (как при обучении)
+        processed = self._preprocess_face(face_roi)
+        self.timer.mark('preprocess')
+        
+        self.cnn_calls += 1
+        start_time = time.perf_counter()
+        prediction = self._predict(processed)
+        self.timer.mark('inference')
+        if self.shadow_run is not None:
+            self.shadow_run.submit(face_roi, prediction, time.perf_counter() - start_time)
+            self.timer.mark('shadow')
+        return prediction
+
+    def _eye_aspect_ratio(self, rgb_roi: np.ndarray):
+        """Mean eye aspect ratio of both eyes, or None if no landmarks were found"""
+        results = self.face_mesh.process(np.ascontiguousarray(rgb_roi))
+        if not results.multi_face_landmarks:
+            return None
+        
+        landmarks = results.multi_face_landmarks[0].landmark
+        h, w = rgb_roi.shape[:2]
+        ratios = []
+        for indices in (LEFT_EYE_LANDMARKS, RIGHT_EYE_LANDMARKS):
+            p1, p2, p3, p4, p5, p6 = (np.array([landmarks[i].x * w, landmarks[i].y * h]) for i in indices)
+            horizontal = np.linalg.norm(p1 - p4)
+            if horizontal == 0:
+                return None
+            ratios.append((np.linalg.norm(p2 - p6) + np.linalg.norm(p3 - p5)) / (2.0 * horizontal))
+        return float(np.mean(ratios))
+
+    def get_inference_stats(self) -> dict:
+        """CNN call counts and cascade agreement against CNN-only scoring"""
+        stats = {'cnn_calls': self.cnn_calls}
+        if self.skip_duplicates:
+            stats['skipped_inferences'] = self.skipped_inferences
+        if self.face_mesh is not None:
+            stats['cascade_confident'] = self.cascade_confident
+            stats['cascade_samples'] = self.cascade_samples
+            stats['cascade_agreement'] = (self.cascade_agreements / self.cascade_samples
+                                          if self.cascade_samples else None)
+            stats['cascade_mean_abs_error'] = (self.cascade_abs_error / self.cascade_samples
+                                               if self.cascade_samples else None)
+        return stats
+
+    def _predict(self, processed: np.ndarray) -> float:
+        """Fatigue score for one preprocessed face"""
+        if self.inference_service is not None:
+            try:
+                return self.inference_service.predict(processed)
+            except RuntimeError:
+                # Service of a version retired mid-analysis was stopped: score directly
+                self.inference_service = None
+        if self.predictor is not None:
+            return float(self.predictor.predict_on_batch(processed[None, ...])[0][0])
+        return self.model.predict(processed[None, ...], verbose=0)[0][0]
+
     def _preprocess_face(self, face: np.ndarray) -> np.ndarray:
         """Preprocess face exactly as during training"""
-        logger.debug(f"Preprocessing face, original shape: {face.shape}")
-        
         # Resize to 48x48 as model was trained
         face = cv2.resize(face, (48, 48))
-        logger.debug(f"After resize: {face.shape}")
+        
+        # Fused model normalizes (and converts to gray) itself: pass the uint8 crop as is
+        if self.fused_preprocessing:
+            return face
         
         # Convert to float32 and normalize to [0,1] as during training
         face = face.astype(np.float32) / 255.0
-        logger.debug(f"After normalization: min={face.min():.3f}, max={face.max():.3f}")
         
         # If model expects grayscale but we have color, convert
-        if len(face.shape) == 3 and face.shape[2] == 3:
-            # Check if model expects grayscale (single channel)
-            expected_shape = self.model.input_shape
-            if len(expected_shape) == 4 and expected_shape[-1] == 1:
-                face = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
-                face = np.expand_dims(face, axis=-1)
-                logger.debug(f"Converted to grayscale: {face.shape}")
+        if self.expects_grayscale and len(face.shape) == 3 and face.shape[2] == 3:
+            face = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+            face = np.expand_dims(face, axis=-1)
         
         return face
 
     def _update_buffer(self, value: float):
+        if self.score_listener is not None:
+            self.score_listener(value)
         self.buffer.append(value)
         if len(self.buffer) > self.buffer_size:
             self.buffer.pop(0)
 
+    def get_progress(self) -> dict:
+        """Snapshot of the running counters for progress reporting"""
+        return {
+            'frames_processed': self.total_frames,
+            'faces_detected': self.face_detected_frames,
+            'face_detection_rate': self.face_detected_frames / self.total_frames if self.total_frames > 0 else 0,
+            'current_score': round(float(np.mean(self.buffer)), 3) if self.buffer else None
+        }
+
     def get_final_score(self) -> dict:
         """Return final analysis results"""
         if not self.buffer:
@@ -199,16 +524,12 @@ class FatigueAnalyzer:
                 'score': 0.0, 
                 'percent': 0.0,
                 'face_detection_rate': 0,
-                'avg_processing_time': 0
+                'avg_processing_time': 0,
+                'model_version': self.model_version
             }
             
         avg_score = np.mean(self.buffer)
-        if avg_score < 0.3:
-            level = "Low"
-        elif avg_score < 0.7:
-            level = "Medium"
-        else:
-            level = "High"
+        level = score_level(avg_score)
         
         # Calculate statistics
         avg_processing_time = np.mean(self.processing_times) if self.processing_times else 0
@@ -223,7 +544,9 @@ class FatigueAnalyzer:
             'score': round(avg_score, 2),
             'percent': round(avg_score * 100, 1),
             'face_detection_rate': face_detection_rate,
-            'avg_processing_time': avg_processing_time
+            'avg_processing_time': avg_processing_time,
+            'model_version': self.model_version,
+            'inference': self.get_inference_stats()
         }
 
     def close(self):
@@ -231,65 +554,322 @@ class FatigueAnalyzer:
         logger.info("Closing FatigueAnalyzer")
         if hasattr(self, 'face_detection'):
             self.face_detection.close()
+        if getattr(self, 'face_mesh', None) is not None:
+            self.face_mesh.close()
+
+def analyze_source(source, is_video_file=False, output_file=None, video_info=None,
+                   max_duration=None, strategy=None, decoder=None, progress_callback=None,
+                   cascade=None, skip_duplicates=None, fused_preprocessing=None, compiled=None,
+                   request_id=None, checkpoint_key=None, long_video=None, phases=None):
+    """Main analysis function
 
-def analyze_source(source, is_video_file=False, output_file=None):
-    """Main analysis function"""
-    logger.info(f"Starting analysis - Source: {source}, Video file: {is_video_file}")
+    For video files a probe stage runs first: video_info (a FatigueVideos
+    catalog row or probe_video() result) is checked against the limits and
+    used to choose the sampling strategy before the analyzer is constructed.
+    
+    decoder selects the frame source for video files: 'opencv' or 'ffmpeg'
+    (scaling and frame-rate reduction done inside the decoder).
+    
+    progress_callback, if given, is called at most every PROGRESS_INTERVAL
+    seconds with the analyzer counters, expected frame count and ETA.
+    
+    cascade enables the eye-closure estimator in front of the CNN
+    (default: FATIGUE_CASCADE); skip_duplicates reuses the previous score for
+    near-identical face crops (default: FATIGUE_SKIP_DUPLICATES);
+    fused_preprocessing feeds uint8 crops to a model with normalization built
+    in (default: FATIGUE_FUSED_PREPROCESSING); compiled scores faces through
+    traced tf.function graphs (default: FATIGUE_COMPILED_INFERENCE).
+    
+    The result carries per-stage timings (decode, resize, color, detect,
+    gating, preprocess, inference, draw, encode) tagged with request_id.
+    
+    With checkpoint_key (or in long-video mode) the analyzer state and video
+    position are checkpointed every CHECKPOINT_INTERVAL seconds and a later
+    call with the same key resumes from there. Long-video mode (default: for
+    videos of at least LONG_VIDEO_THRESHOLD seconds) also caps per-frame
+    bookkeeping and skips shadow evaluation, so memory stays flat.
+    
+    phases (see flight_phases.build_phase_plan) replaces the uniform sampling
+    of a video file with a per-segment frame_step, and the result gets a
+    score per phase.
+    """
+    logger.info(f"[{request_id}] Starting analysis - Source: {source}, Video file: {is_video_file}")
     
     analyzer = None
+    checkpoint = None
+    cap = None
+    out = None
     try:
-        analyzer = FatigueAnalyzer('neural_network/data/models/fatigue_model.keras')
+        frame_step = 1
+        scale = 1.0
+        no_face_abort_frames = None
+        # Duration limit checked while decoding, for containers that do not record their length
+        decode_limit = None
+        if is_video_file:
+            if video_info is None:
+                video_info = probe_video(source)
+            check_video_limits(video_info, max_duration=max_duration)
+            if max_duration and not video_info.get('duration'):
+                decode_limit = max_duration
+            
+            if strategy is None:
+                strategy = choose_analysis_strategy(video_info)
+            frame_step = strategy.get('frame_step', 1)
+            scale = strategy.get('scale', 1.0)
+            no_face_abort_frames = strategy.get('no_face_abort_frames')
+            if phases:
+                # Decode at the densest phase rate; sparser phases skip more frames
+                frame_step = min(segment['frame_step'] for segment in phases)
+                logger.info(f"Flight phase plan: {phases}")
+            logger.info(f"Analysis strategy: {strategy}")
+        
+        checkpoint = None
+        resume_state = None
+        if is_video_file:
+            if long_video is None:
+                long_video = float(video_info.get('duration') or 0) >= LONG_VIDEO_THRESHOLD
+            if checkpoint_key or long_video:
+                checkpoint = AnalysisCheckpoint(checkpoint_key or default_checkpoint_key(source))
+                if not checkpoint.acquire():
+                    # Same video already being analyzed: run without touching its checkpoint
+                    logger.warning(f"[{request_id}] Checkpoint {checkpoint.key} is in use by another "
+                                   f"analysis, continuing without checkpoints")
+                    checkpoint = None
+            if checkpoint:
+                resume_state = checkpoint.load()
+                if resume_state:
+                    logger.info(f"[{request_id}] Resuming from checkpoint at "
+                                f"{resume_state['position_seconds']:.1f}s, frame {resume_state['frame_count']}")
+        
+        analyzer = FatigueAnalyzer('neural_network/data/models/fatigue_model.keras',
+                                   cascade=cascade, skip_duplicates=skip_duplicates,
+                                   fused_preprocessing=fused_preprocessing, compiled=compiled)
+        if long_video:
+            analyzer.timer = StageTimer(max_samples=LONG_VIDEO_TIMER_SAMPLES)
+        else:
+            analyzer.shadow_run = start_shadow_run(source, analyzer.model_version)
+        if resume_state:
+            analyzer.set_state(dict(resume_state['analyzer'], last_face_time=time.time()))
+        
+        # Per phase: [score sum, score count, analyzed frames]
+        phase_totals = [[0.0, 0, 0] for _ in phases or ()]
+        if phases and resume_state and len(resume_state.get('phase_totals') or ()) == len(phases):
+            phase_totals = resume_state['phase_totals']
+        phase_index = 0
         
-        cap = cv2.VideoCapture(source if is_video_file else 0)
+        def record_phase_score(value):
+            phase_totals[phase_index][0] += float(value)
+            phase_totals[phase_index][1] += 1
+        
+        if phases:
+            analyzer.score_listener = record_phase_score
+        
+        expected_frames = None
+        if phases:
+            expected_frames = expected_phase_frames(phases, video_info.get('fps'))
+        elif video_info is not None and video_info.get('frame_count'):
+            expected_frames = int(video_info['frame_count']) // frame_step
+        
+        def report_progress(finished=False):
+            elapsed = time.time() - start_time
+            progress = analyzer.get_progress()
+            progress['elapsed_seconds'] = round(elapsed, 2)
+            progress['expected_frames'] = expected_frames
+            progress['frames_per_second'] = round(frame_count / elapsed, 2) if elapsed > 0 else 0
+            progress['eta_seconds'] = None
+            if finished:
+                progress['eta_seconds'] = 0
+            elif expected_frames and frame_count:
+                remaining = max(expected_frames - frame_count, 0)
+                progress['eta_seconds'] = round(remaining * elapsed / frame_count, 1)
+            progress_callback(progress)
+        
+        # Source seconds per reader frame and the source time of reader frame 0 (for checkpoints)
+        frame_period = None
+        base_position = 0.0
+        resume_position = resume_state['position_seconds'] if resume_state else 0.0
+        if video_info is not None:
+            frame_width, frame_height = (int(v) for v in video_info['resolution'].split('x'))
+            fps = video_info.get('fps') or 30.0
+            analysis_size = (int(frame_width * scale), int(frame_height * scale))
+            
+            if (decoder or DEFAULT_DECODER) == 'ffmpeg':
+                try:
+                    cap = FFmpegFrameSource(source, *analysis_size,
+                                            fps=fps / frame_step if frame_step > 1 else None,
+                                            start_time=resume_position or None)
+                    frame_period = frame_step / fps
+                    base_position = resume_position
+                    # Sampling and scaling now happen inside ffmpeg
+                    frame_step, scale = 1, 1.0
+                except (ImportError, FileNotFoundError) as e:
+                    logger.warning(f"ffmpeg decoder unavailable ({e}), falling back to OpenCV")
+        
+        if cap is None:
+            cap = cv2.VideoCapture(source if is_video_file else 0)
         if not cap.isOpened():
             error_msg = f"Failed to open video source: {source}"
             logger.error(error_msg)
             raise ValueError(error_msg)
         
+        frame_index = -1
+        if is_video_file and frame_period is None:
+            frame_period = 1.0 / (video_info.get('fps') or 30.0) if video_info else 1.0 / 30.0
+            if resume_position:
+                frame_index = int(round(resume_position / frame_period)) - 1
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index + 1)
+        
+        phase_steps = []
+        if phases:
+            # Phase frame steps are in source frames; the reader may already be sampling
+            phase_steps = [max(1, int(round(segment['frame_step'] / fps / frame_period))) for segment in phases]
+            phase_index = phase_index_at(phases, resume_position)
+        
         # Get video properties
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        if video_info is None:
+            frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            analysis_size = (int(frame_width * scale), int(frame_height * scale))
         
         logger.info(f"Video properties - Resolution: {frame_width}x{frame_height}, FPS: {fps}")
         
-        out = None
+        # Live camera: capture on its own thread, always process the newest frame
+        if not is_video_file:
+            cap = LatestFrameCapture(cap)
+        
+        segment_path = None
+        fourcc = cv2.VideoWriter_fourcc(*'H264')
         if output_file:
-            fourcc = cv2.VideoWriter_fourcc(*'H264')
-            out = cv2.VideoWriter(output_file, fourcc, 20.0, 
-                                (frame_width, frame_height))
-            logger.info(f"Output video writer initialized: {output_file}")
+            # With checkpoints the output is written in segments that are joined at the end
+            segment_path = checkpoint.next_segment_path() if checkpoint else None
+            out = cv2.VideoWriter(segment_path or output_file, fourcc, 20.0, analysis_size)
+            logger.info(f"Output video writer initialized: {segment_path or output_file}")
         
-        frame_count = 0
+        frame_count = resume_state['frame_count'] if resume_state else 0
         start_time = time.time()
+        last_progress_time = start_time
+        last_checkpoint_time = start_time
+        timer = analyzer.timer
+        grab_time = 0.0
+        
+        def save_checkpoint():
+            nonlocal out, segment_path
+            if out:
+                out.release()
+                checkpoint.segments.append(segment_path)
+            state = analyzer.get_state()
+            checkpoint.save({
+                'source': str(source),
+                'position_seconds': base_position + (frame_index + 1) * frame_period,
+                'frame_count': frame_count,
+                'analyzer': {
+                    'buffer': [float(v) for v in state['buffer']],
+                    'face_detected_frames': state['face_detected_frames'],
+                    'total_frames': state['total_frames'],
+                    'processing_times': [float(v) for v in state['processing_times']],
+                    'last_prediction': None if state['last_prediction'] is None else float(state['last_prediction']),
+                    'duplicate_reuses': state['duplicate_reuses']
+                },
+                'phase_totals': phase_totals
+            })
+            if out:
+                segment_path = checkpoint.next_segment_path()
+                out = cv2.VideoWriter(segment_path, fourcc, 20.0, analysis_size)
         
         while cap.isOpened():
+            frame_index += 1
+            step = frame_step
+            if phases:
+                position = base_position + frame_index * frame_period
+                while phase_index + 1 < len(phases) and position >= phases[phase_index + 1]['start']:
+                    phase_index += 1
+                step = phase_steps[phase_index]
+            if decode_limit and base_position + frame_index * frame_period > decode_limit:
+                logger.warning(f"Video is longer than {decode_limit:.0f}s, analysis stopped at the limit")
+                break
+            # Skipped frames: grab() still decodes but skips the conversion and copy; the ffmpeg
+            # source seeks over long gaps instead, decoding only from the keyframe before the target
+            if step > 1 and frame_index % step:
+                stage_start = time.perf_counter()
+                next_index = frame_index + step - frame_index % step
+                if phases and phase_index + 1 < len(phases):
+                    next_index = min(next_index, int(np.ceil(
+                        (phases[phase_index + 1]['start'] - base_position) / frame_period)))
+                if (isinstance(cap, FFmpegFrameSource)
+                        and (next_index - frame_index) * frame_period >= FFMPEG_SEEK_MIN_GAP):
+                    cap.seek(base_position + next_index * frame_period)
+                    frame_index = next_index - 1
+                    grab_time += time.perf_counter() - stage_start
+                    continue
+                if not cap.grab():
+                    logger.info("End of video stream")
+                    break
+                grab_time += time.perf_counter() - stage_start
+                continue
+            
+            stage_start = time.perf_counter()
             ret, frame = cap.read()
             if not ret:
                 logger.info("End of video stream")
                 break
+            # Decode time of an analyzed frame includes grabbing the frames skipped before it
+            timer.add('decode', grab_time + time.perf_counter() - stage_start)
+            grab_time = 0.0
+            
+            if scale < 1.0:
+                stage_start = time.perf_counter()
+                frame = cv2.resize(frame, analysis_size, interpolation=cv2.INTER_AREA)
+                timer.add('resize', time.perf_counter() - stage_start)
                 
             frame_count += 1
             processed = analyzer.process_frame(frame, show_visualization=True)
+            if phases:
+                phase_totals[phase_index][2] += 1
             
             if output_file and out:
+                stage_start = time.perf_counter()
                 out.write(processed)
+                timer.add('encode', time.perf_counter() - stage_start)
+            
+            if progress_callback and time.time() - last_progress_time >= PROGRESS_INTERVAL:
+                last_progress_time = time.time()
+                report_progress()
+            
+            if checkpoint and time.time() - last_checkpoint_time >= CHECKPOINT_INTERVAL:
+                save_checkpoint()
+                last_checkpoint_time = time.time()
             
             # Показываем для всех режимов если это не видеофайл
             if not is_video_file:
+                cap.frame_done()
                 cv2.imshow('Fatigue Analysis', processed)
                 if cv2.waitKey(1) & 0xFF == ord('q'):
                     logger.info("User pressed 'q', stopping analysis")
                     break
+            elif no_face_abort_frames and frame_count >= no_face_abort_frames \
+                    and analyzer.face_detected_frames == 0:
+                logger.warning(f"No face detected in first {frame_count} analyzed frames, stopping early")
+                break
         
         total_time = time.time() - start_time
         logger.info(f"Analysis completed - Processed {frame_count} frames in {total_time:.2f}s")
         
+        if progress_callback:
+            report_progress(finished=True)
+        
         cap.release()
         if out:
             out.release()
         cv2.destroyAllWindows()
         
+        if checkpoint:
+            if out:
+                checkpoint.segments.append(segment_path)
+                concat_segments(checkpoint.segments, output_file, 20.0, analysis_size)
+            # Finished: a new analysis of this video starts from the beginning
+            checkpoint.clear()
+        
         # Get final result
         result = analyzer.get_final_score()
         
@@ -306,7 +886,8 @@ def analyze_source(source, is_video_file=False, output_file=None):
                 'face_detected_ratio': 0,
                 'frames_analyzed': analyzer.total_frames,
                 'resolution': f"{frame_width}x{frame_height}",
-                'fps': int(fps)
+                'fps': int(fps),
+                'model_version': analyzer.model_version
             }
         
         # Добавляем метаданные
@@ -314,6 +895,24 @@ def analyze_source(source, is_video_file=False, output_file=None):
         result['frames_analyzed'] = analyzer.total_frames
         result['resolution'] = f"{frame_width}x{frame_height}"
         result['fps'] = int(fps)
+        result['frame_step'] = frame_step
+        result['decoder'] = 'ffmpeg' if isinstance(cap, FFmpegFrameSource) else 'opencv'
+        if isinstance(cap, LatestFrameCapture):
+            result['capture_stats'] = cap.stats()
+        if strategy:
+            result['analysis_strategy'] = strategy
+        if phases:
+            result['phases'] = []
+            for segment, (score_sum, score_count, frames) in zip(phases, phase_totals):
+                score = score_sum / score_count if score_count else None
+                result['phases'].append(dict(segment, frames_analyzed=frames,
+                                             score=round(score, 3) if score is not None else None,
+                                             level=score_level(score) if score is not None else 'No data'))
+        if analyzer.shadow_run is not None:
+            result['shadow_run_id'] = analyzer.shadow_run.run_id
+        result['request_id'] = request_id
+        result['stage_timings'] = timer.summary()
+        logger.info(f"[{request_id}] Stage timings: {result['stage_timings']}")
         
         logger.info(f"Analysis result: {result}")
         return result['level'], result['percent'], result
@@ -329,6 +928,98 @@ def analyze_source(source, is_video_file=False, output_file=None):
             'frames_analyzed': 0
         }
     finally:
+        # Released here as well so an error mid-analysis doesn't leak the decoder (ffmpeg process) or writer
+        if cap is not None:
+            cap.release()
+        if out is not None:
+            out.release()
+        if checkpoint:
+            checkpoint.release()
+        if analyzer:
+            if analyzer.shadow_run is not None:
+                analyzer.shadow_run.close()
+            analyzer.close()
+
+def quick_score(source, video_info=None, sample_count=PREVIEW_SAMPLE_COUNT):
+    """Provisional score from a sparse uniform sample of frames.
+    
+    Seeks to sample_count evenly spaced positions instead of decoding the whole
+    video; the result is marked provisional and is meant to be replaced by the
+    full analyze_source() result.
+    """
+    logger.info(f"Starting quick score - Source: {source}, samples: {sample_count}")
+    
+    analyzer = None
+    cap = None
+    try:
+        if video_info is None:
+            video_info = probe_video(source)
+        check_video_limits(video_info, max_duration=None)
+        
+        frame_count = int(video_info.get('frame_count') or 0)
+        scale = choose_analysis_strategy(video_info).get('scale', 1.0)
+        frame_width, frame_height = (int(v) for v in video_info['resolution'].split('x'))
+        analysis_size = (int(frame_width * scale), int(frame_height * scale))
+        
+        analyzer = FatigueAnalyzer('neural_network/data/models/fatigue_model.keras',
+                                   buffer_size=sample_count)
+        
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise ValueError(f"Failed to open video source: {source}")
+        
+        start_time = time.time()
+        if frame_count:
+            positions = np.linspace(0, frame_count - 1, num=min(sample_count, frame_count), dtype=int)
+            for position in positions:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(position))
+                ret, frame = cap.read()
+                if not ret:
+                    continue
+                if scale < 1.0:
+                    frame = cv2.resize(frame, analysis_size, interpolation=cv2.INTER_AREA)
+                analyzer.process_frame(frame)
+        else:
+            # Length unknown (streamed WebM), no seeking: one frame per second from the start
+            stride = max(1, int(round(video_info.get('fps') or 30.0)))
+            index = 0
+            while analyzer.total_frames < sample_count and cap.grab():
+                if index % stride == 0:
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        if scale < 1.0:
+                            frame = cv2.resize(frame, analysis_size, interpolation=cv2.INTER_AREA)
+                        analyzer.process_frame(frame)
+                index += 1
+        
+        logger.info(f"Quick score completed - Sampled {analyzer.total_frames} frames in {time.time() - start_time:.2f}s")
+        
+        result = analyzer.get_final_score()
+        result['provisional'] = True
+        result['face_detected_ratio'] = result.get('face_detection_rate', 0)
+        result['frames_analyzed'] = analyzer.total_frames
+        result['resolution'] = video_info['resolution']
+        result['fps'] = int(video_info.get('fps') or 0)
+        
+        if result['level'] == 'No data':
+            result['level'] = 'Unknown'
+        
+        return result['level'], result['percent'], result
+        
+    except Exception as e:
+        logger.error(f"Quick score error: {str(e)}", exc_info=True)
+        return "Unknown", 0, {
+            'level': 'Unknown',
+            'score': 0.0,
+            'percent': 0.0,
+            'provisional': True,
+            'error': str(e),
+            'face_detected_ratio': 0,
+            'frames_analyzed': 0
+        }
+    finally:
+        if cap is not None:
+            cap.release()
         if analyzer:
             analyzer.close()
 
@@ -367,6 +1058,9 @@ def real_time_test():
         print(f"Камера инициализирована: {actual_width}x{actual_height} @ {actual_fps} FPS")
         logger.info(f"Camera initialized: {actual_width}x{actual_height} @ {actual_fps} FPS")
         
+        # Захват в отдельном потоке: обрабатываем всегда самый свежий кадр
+        cap = LatestFrameCapture(cap)
+        
         frame_count = 0
         fps_counter = 0
         fps_start_time = time.time()
@@ -387,9 +1081,11 @@ def real_time_test():
             # Обрабатываем кадр с визуализацией
             processed_frame = analyzer.process_frame(frame, show_visualization=True)
             
+            cap.frame_done()
+            
             # Добавляем информационную панель
             h, w = processed_frame.shape[:2]
-            info_panel = np.zeros((140, w, 3), dtype=np.uint8)
+            info_panel = np.zeros((165, w, 3), dtype=np.uint8)
             
             # Получаем статистику
             current_score = np.mean(analyzer.buffer) if analyzer.buffer else 0
@@ -410,6 +1106,8 @@ def real_time_test():
                        (10, 75), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
             cv2.putText(info_panel, f"Frames: {analyzer.total_frames} | Faces: {analyzer.face_detected_frames}", 
                        (10, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            cv2.putText(info_panel, f"Dropped: {cap.frames_dropped} | Latency: {cap.last_latency_ms:.0f} ms", 
+                       (10, 125), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
             
             # Статус
             status_color = (0, 255, 0) if detection_rate > 0.5 else (0, 165, 255) if detection_rate > 0 else (0, 0, 255)
@@ -451,6 +1149,11 @@ def real_time_test():
         print(f"Процент: {final_result.get('percent', 0):.1f}%")
         print(f"Частота обнаружения лица: {final_result.get('face_detection_rate', 0):.1%}")
         print(f"Среднее время обработки кадра: {final_result.get('avg_processing_time', 0):.3f}s")
+        capture_stats = cap.stats()
+        print(f"Пропущено кадров: {capture_stats['frames_dropped']} из {capture_stats['frames_captured']} "
+              f"({capture_stats['drop_rate']:.1%})")
+        print(f"Задержка кадра: средняя {capture_stats['latency_ms_mean']:.0f} мс, "
+              f"p95 {capture_stats['latency_ms_p95']:.0f} мс")
         
         cap.release()
         cv2.destroyAllWindows()
@@ -460,16 +1163,252 @@ def real_time_test():
         logger.error(f"Error in real-time test: {e}", exc_info=True)
         print(f"Ошибка: {e}")
 
+def replay_test(source, loop=False, duration=None, report_file=None):
+    """Headless realtime test: replay video file(s) as a camera at native FPS.
+    
+    Frames are dropped when processing falls behind, exactly as with a live
+    camera. Returns (and optionally writes) a JSON-serializable report with
+    achieved FPS, latency percentiles and drop rate.
+    """
+    logger.info(f"Starting replay test - Source: {source}, loop: {loop}, duration: {duration}")
+    
+    analyzer = FatigueAnalyzer('neural_network/data/models/fatigue_model.keras')
+    cap = LatestFrameCapture(ReplayCapture(source, loop=loop))
+    try:
+        source_fps = cap.get(cv2.CAP_PROP_FPS)
+        start_time = time.perf_counter()
+        
+        while True:
+            if duration and time.perf_counter() - start_time >= duration:
+                break
+            ret, frame = cap.read()
+            if not ret:
+                break
+            analyzer.process_frame(frame)
+            cap.frame_done()
+        
+        elapsed = time.perf_counter() - start_time
+        capture_stats = cap.stats()
+        result = analyzer.get_final_score()
+        
+        report = {
+            'source': source,
+            'loop': loop,
+            'elapsed_seconds': round(elapsed, 2),
+            'source_fps': round(source_fps, 2),
+            'achieved_fps': round(capture_stats['frames_processed'] / elapsed, 2) if elapsed > 0 else 0,
+            **capture_stats,
+            'fatigue_level': result['level'],
+            'fatigue_score': float(result['score']),
+            'face_detection_rate': result['face_detection_rate'],
+            'avg_processing_time': float(result['avg_processing_time'])
+        }
+    finally:
+        cap.release()
+        analyzer.close()
+    
+    logger.info(f"Replay test report: {report}")
+    if report_file:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+# Columns of a batch results file (CSV header; keys of each JSONL record)
+BATCH_FIELDS = ('path', 'level', 'score', 'error', 'frames_analyzed', 'face_detected_ratio', 'resolution',
+                'fps', 'decoder', 'model_version', 'output_file', 'elapsed_seconds', 'frames_per_second',
+                'stage_mean_ms', 'finished_at')
+
+def list_batch_inputs(source: str) -> list:
+    """Video files of a directory (recursively) or of a manifest with one path per line.
+    
+    Relative manifest paths are resolved against the manifest's directory;
+    empty lines and lines starting with '#' are ignored.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files)
+                         if name.lower().endswith(VIDEO_EXTENSIONS))
+        return paths
+    
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(base_dir, line) for line in lines if line and not line.startswith('#')]
+
+def read_batch_results(results_file: str) -> dict:
+    """Records already in a results file, by absolute video path"""
+    if not os.path.exists(results_file):
+        return {}
+    records = {}
+    with open(results_file, encoding='utf-8', newline='') as f:
+        if results_file.endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            records[os.path.abspath(row['path'])] = row
+    return records
+
+def _analyze_batch_item(path, output_dir, engine_options):
+    output_file = None
+    if output_dir:
+        # Inputs from different directories may share a name: the path hash keeps outputs apart
+        path_hash = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]
+        output_file = os.path.join(output_dir, f"{Path(path).stem}_{path_hash}_analyzed.mp4")
+    
+    start_time = time.perf_counter()
+    level, percent, details = analyze_source(path, is_video_file=True, output_file=output_file,
+                                             request_id=Path(path).stem, **engine_options)
+    elapsed = time.perf_counter() - start_time
+    frames = details.get('frames_analyzed', 0)
+    return {
+        'path': os.path.abspath(path),
+        'level': level,
+        'score': round((percent or 0) / 100, 4),
+        'error': details.get('error'),
+        'frames_analyzed': frames,
+        'face_detected_ratio': round(float(details.get('face_detected_ratio', 0)), 4),
+        'resolution': details.get('resolution'),
+        'fps': details.get('fps'),
+        'decoder': details.get('decoder'),
+        'model_version': details.get('model_version'),
+        'output_file': output_file if not details.get('error') else None,
+        'elapsed_seconds': round(elapsed, 3),
+        'frames_per_second': round(frames / elapsed, 2) if elapsed > 0 else 0,
+        'stage_mean_ms': {stage: t['mean_ms'] for stage, t in details.get('stage_timings', {}).items()},
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+def batch_analyze(source, results_file, workers=None, output_dir=None, skip_existing=True, **engine_options):
+    """Analyze every video of a directory or manifest, one results line per video.
+    
+    Videos are analyzed by a pool of threads in this process, so TensorFlow is
+    imported and the model loaded once for the whole batch. Each record is
+    appended to results_file (.csv, otherwise JSON lines) as soon as its video
+    finishes; with skip_existing, videos that already have a successful
+    record are not analyzed again, so an interrupted backfill can be rerun.
+    engine_options are passed on to analyze_source (decoder, cascade, ...).
+    """
+    configure_threads()
+    workers = workers or THREAD_BUDGET['analysis_workers']
+    paths = list_batch_inputs(source)
+    
+    done = set()
+    if skip_existing:
+        done = {path for path, record in read_batch_results(results_file).items() if not record.get('error')}
+    pending = [path for path in paths if os.path.abspath(path) not in done]
+    logger.info(f"Batch analysis - {len(paths)} videos, {len(paths) - len(pending)} already done, "
+                f"{workers} workers")
+    
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    # Load the model before the workers start, they all use this one copy
+    load_shared_model('neural_network/data/models/fatigue_model.keras')
+    
+    is_csv = results_file.endswith('.csv')
+    write_header = is_csv and not os.path.exists(results_file)
+    summary = {'videos': len(paths), 'skipped': len(paths) - len(pending), 'analyzed': 0, 'failed': 0}
+    start_time = time.perf_counter()
+    with open(results_file, 'a', encoding='utf-8', newline='') as f, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fatigue-batch') as pool:
+        writer = csv.DictWriter(f, fieldnames=BATCH_FIELDS) if is_csv else None
+        if write_header:
+            writer.writeheader()
+        
+        futures = {pool.submit(_analyze_batch_item, path, output_dir, engine_options): path for path in pending}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                logger.error(f"Batch analysis of {futures[future]} failed: {e}", exc_info=True)
+                record = {'path': os.path.abspath(futures[future]), 'error': str(e),
+                          'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            
+            summary['analyzed'] += 1
+            summary['failed'] += int(bool(record.get('error')))
+            if writer:
+                writer.writerow(dict(record, stage_mean_ms=json.dumps(record.get('stage_mean_ms', {}))))
+            else:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            logger.info(f"Batch {summary['analyzed']}/{len(pending)}: {record['path']} -> "
+                        f"{record.get('level')} {record.get('error') or ''}")
+    
+    elapsed = time.perf_counter() - start_time
+    summary['elapsed_seconds'] = round(elapsed, 2)
+    summary['videos_per_hour'] = round(summary['analyzed'] / elapsed * 3600, 1) if elapsed > 0 else 0
+    logger.info(f"Batch analysis finished: {summary}")
+    return summary
+
 if __name__ == '__main__':
+    setup_logging()
     parser = argparse.ArgumentParser(description='Fatigue Analysis Tool')
-    parser.add_argument('--mode', choices=['video', 'realtime', 'test'], required=True,
-                       help='Analysis mode: video file, realtime camera, or test interface')
-    parser.add_argument('--input', help='Path to input video (for video mode)')
-    parser.add_argument('--output', help='Path to output video')
+    parser.add_argument('--mode', choices=['video', 'realtime', 'test', 'replay', 'batch'], required=True,
+                       help='Analysis mode: video file, realtime camera, test interface, '
+                            'headless realtime replay of video files, or batch analysis of many files')
+    parser.add_argument('--input', help='Path to input video (video mode), video/directory (replay mode) '
+                                        'or directory/manifest (batch mode)')
+    parser.add_argument('--output', help='Path to output video (directory for annotated videos in batch mode)')
+    parser.add_argument('--decoder', choices=['opencv', 'ffmpeg'], default=None,
+                       help='Frame source for video files (default: FATIGUE_DECODER or opencv)')
+    parser.add_argument('--cascade', action='store_true', default=None,
+                       help='Score faces with the eye-closure estimator first, CNN only when uncertain')
+    parser.add_argument('--skip-duplicates', action='store_true', default=None,
+                       help='Reuse the previous score when the face crop barely changed')
+    parser.add_argument('--fused-preprocessing', action='store_true', default=None,
+                       help='Feed uint8 crops to a model with normalization folded into the graph')
+    parser.add_argument('--compiled', action='store_true', default=None,
+                       help='Score faces through traced tf.function graphs instead of model.predict')
+    parser.add_argument('--loop', action='store_true', help='Loop the input files (replay mode)')
+    parser.add_argument('--duration', type=float, help='Stop replay after this many seconds')
+    parser.add_argument('--report', help='Write the replay report JSON to this file')
+    parser.add_argument('--results', default='batch_results.jsonl',
+                       help='Batch results file, .csv or JSON lines (batch mode)')
+    parser.add_argument('--workers', type=int,
+                       help='Videos analyzed in parallel (batch mode, default: from the CPU budget)')
+    parser.add_argument('--no-skip-existing', dest='skip_existing', action='store_false',
+                       help='Analyze videos again even if the results file has them (batch mode)')
+    parser.add_argument('--profile', metavar='PATH',
+                       help='Run under cProfile and write pstats data to PATH')
     args = parser.parse_args()
     
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    
     if args.mode == 'test':
         real_time_test()
+    elif args.mode == 'replay':
+        if not args.input:
+            print("Error: Input video or directory required for replay mode")
+            print("Usage: python predict.py --mode replay --input path/to/videos [--loop --duration 60]")
+            exit(1)
+        
+        report = replay_test(args.input, loop=args.loop, duration=args.duration, report_file=args.report)
+        print(json.dumps(report, indent=2))
+    elif args.mode == 'batch':
+        if not args.input:
+            print("Error: Input directory or manifest required for batch mode")
+            print("Usage: python predict.py --mode batch --input path/to/videos [--results results.csv --workers 4]")
+            exit(1)
+        
+        summary = batch_analyze(
+            args.input,
+            args.results,
+            workers=args.workers,
+            output_dir=args.output,
+            skip_existing=args.skip_existing,
+            decoder=args.decoder,
+            cascade=args.cascade,
+            skip_duplicates=args.skip_duplicates,
+            fused_preprocessing=args.fused_preprocessing,
+            compiled=args.compiled
+        )
+        print(json.dumps(summary, indent=2))
     elif args.mode == 'video':
         if not args.input:
             print("Error: Input video required for video mode")
@@ -479,13 +1418,21 @@ if __name__ == '__main__':
         level, percent, details = analyze_source(
             source=args.input,
             is_video_file=True,
-            output_file=args.output
+            output_file=args.output,
+            decoder=args.decoder,
+            cascade=args.cascade,
+            skip_duplicates=args.skip_duplicates,
+            fused_preprocessing=args.fused_preprocessing,
+            compiled=args.compiled
         )
         
         print(f"Fatigue Level: {level}")
         print(f"Fatigue Percentage: {percent}%")
         if 'error' in details and details['error']:
             print(f"Error: {details['error']}")
+        for stage, timing in details.get('stage_timings', {}).items():
+            print(f"  {stage:<11} {timing['mean_ms']:>8.2f} ms/frame  p95 {timing['p95_ms']:>8.2f} ms  "
+                  f"{timing['share'] * 100:>5.1f}%")
     elif args.mode == 'realtime':
         level, percent, details = analyze_source(
             source=0,
@@ -497,3 +1444,10 @@ if __name__ == '__main__':
         print(f"Fatigue Percentage: {percent}%")
         if 'error' in details and details['error']:
             print(f"Error: {details['error']}")
+    
+    if profiler is not None:
+        import pstats
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to: {args.profile}")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
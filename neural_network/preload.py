@@ -0,0 +1,111 @@
+"""
+Preload support for forking servers (gunicorn --preload, see gunicorn.conf.py).
+
+The parent imports TensorFlow, MediaPipe, OpenCV and the Flask app once and
+freezes the garbage collector, so workers share those pages copy-on-write.
+The Keras model and MediaPipe graphs are created in each worker after the
+fork: both start native thread pools that do not survive fork().
+
+Per-worker memory can be measured with:
+
+    python neural_network/preload.py --master-pid <gunicorn master pid>
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join('neural_network', 'data', 'models', 'fatigue_model.keras')
+# Pin each worker process to its own slice of the CPUs
+PIN_WORKERS = os.environ.get('FATIGUE_PIN_WORKERS', '0') == '1'
+
+
+def preload_parent():
+    """Import the heavy libraries in the parent and keep them out of GC passes.
+
+    gc.freeze() moves every object alive now to a permanent generation, so
+    collections in the workers do not write to (and un-share) those pages.
+    """
+    start_time = time.perf_counter()
+    import cv2  # noqa: F401
+    import mediapipe  # noqa: F401
+    import tensorflow  # noqa: F401
+    import neural_network.predict  # noqa: F401
+
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Preloaded libraries in {time.perf_counter() - start_time:.2f}s, "
+                f"{gc.get_freeze_count()} objects frozen")
+
+
+def init_worker(worker_index: int = 0, workers: int = 1, model_path: str = MODEL_PATH):
+    """Per-worker setup after fork: optional CPU pinning, thread budget, model load"""
+    from neural_network.cpu_budget import configure_threads, pin_to_cpus, worker_cpu_set
+    from neural_network.predict import load_shared_model
+
+    if PIN_WORKERS:
+        pin_to_cpus(worker_cpu_set(worker_index, workers))
+    configure_threads()
+
+    start_time = time.perf_counter()
+    load_shared_model(model_path)
+    logger.info(f"Worker {os.getpid()} ready in {time.perf_counter() - start_time:.2f}s")
+
+
+def memory_usage(pid: int) -> dict:
+    """RSS, PSS and unique (private) memory of a process in MB, from /proc smaps_rollup"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+
+    def mb(kb):
+        return round(kb / 1024, 1)
+
+    return {
+        'pid': pid,
+        'rss_mb': mb(fields.get('Rss', 0)),
+        'pss_mb': mb(fields.get('Pss', 0)),
+        'uss_mb': mb(fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)),
+        'shared_mb': mb(fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0))
+    }
+
+
+def child_pids(pid: int) -> list:
+    pids = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        try:
+            with open(f'/proc/{pid}/task/{task}/children', encoding='utf-8') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            continue
+    return sorted(pids)
+
+
+def worker_memory_report(master_pid: int) -> dict:
+    """Memory of a master process and its workers; uss_mb is what each extra worker costs"""
+    workers = [memory_usage(pid) for pid in child_pids(master_pid)]
+    return {
+        'master': memory_usage(master_pid),
+        'workers': workers,
+        'total_pss_mb': round(sum(worker['pss_mb'] for worker in workers), 1),
+        'mean_worker_uss_mb': round(sum(worker['uss_mb'] for worker in workers) / len(workers), 1)
+        if workers else 0
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-worker memory of a preforked server')
+    parser.add_argument('--master-pid', type=int, required=True)
+    args = parser.parse_args()
+    print(json.dumps(worker_memory_report(args.master_pid), indent=2))
@@ -0,0 +1,58 @@
+import time
+from array import array
+
+import numpy as np
+
+
+class StageTimer:
+    """Per-stage durations of a frame pipeline on the monotonic perf_counter clock.
+
+    start() opens a frame, mark(stage) records the time since the previous
+    mark (or start) under that stage; add() records a duration measured
+    elsewhere. Samples are stored as C doubles, so even multi-hour videos
+    cost a few bytes per stage and frame; past max_samples per stage the
+    older half is discarded (long-lived live-session analyzers).
+    """
+
+    def __init__(self, max_samples: int = 200000):
+        self.samples = {}
+        self.max_samples = max_samples
+        self._last = None
+
+    def start(self):
+        self._last = time.perf_counter()
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.add(stage, now - self._last)
+        self._last = now
+
+    def add(self, stage: str, seconds: float):
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = array('d')
+        samples.append(seconds)
+        if len(samples) > self.max_samples:
+            del samples[:len(samples) // 2]
+
+    def reset(self):
+        self.samples = {}
+        self._last = None
+
+    def summary(self) -> dict:
+        """Count, total, mean and percentiles in ms per stage, plus its share of the total time"""
+        grand_total = sum(sum(samples) for samples in self.samples.values()) or 1.0
+        result = {}
+        for stage, samples in self.samples.items():
+            values = np.frombuffer(samples, dtype=np.float64) * 1000
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            result[stage] = {
+                'count': len(values),
+                'total_ms': round(float(values.sum()), 2),
+                'mean_ms': round(float(values.mean()), 3),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3),
+                'share': round(float(values.sum()) / 1000 / grand_total, 3)
+            }
+        return result
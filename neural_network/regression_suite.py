@@ -0,0 +1,241 @@
+"""
+Score and performance regression suite for analyze_source engine modes.
+
+Builds a fixed corpus of synthetic videos (faces from neural_network/data/img
+moving over a textured background), analyzes each video under every engine
+mode in a separate process and checks scores against the reference
+sequential path. Throughput, stage latencies and peak RSS are appended to a
+JSON history and compared with the previous entry. Runs offline, no camera:
+
+    python neural_network/regression_suite.py
+    python neural_network/regression_suite.py --modes reference compiled --videos path/to/samples
+
+Exits with status 1 when a score or performance check fails.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not measured
+    resource = None
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMG_DIR = os.path.join('neural_network', 'data', 'img')
+CORPUS_DIR = os.path.join('neural_network', 'data', 'regression', 'corpus')
+HISTORY_FILE = os.path.join('neural_network', 'data', 'regression', 'history.json')
+
+FRAME_SIZE = (640, 480)
+CORPUS_FPS = 15
+CORPUS_SECONDS = 6
+
+# analyze_source keyword arguments per mode; 'reference' is the plain sequential path
+ENGINE_MODES = {
+    'reference': {'decoder': 'opencv', 'cascade': False, 'skip_duplicates': False,
+                  'fused_preprocessing': False, 'compiled': False},
+    'ffmpeg': {'decoder': 'ffmpeg', 'cascade': False, 'skip_duplicates': False,
+               'fused_preprocessing': False, 'compiled': False},
+    'fused': {'decoder': 'opencv', 'cascade': False, 'skip_duplicates': False,
+              'fused_preprocessing': True, 'compiled': False},
+    'compiled': {'decoder': 'opencv', 'cascade': False, 'skip_duplicates': False,
+                 'fused_preprocessing': False, 'compiled': True},
+    'fused_compiled': {'decoder': 'opencv', 'cascade': False, 'skip_duplicates': False,
+                       'fused_preprocessing': True, 'compiled': True},
+    'skip_duplicates': {'decoder': 'opencv', 'cascade': False, 'skip_duplicates': True,
+                        'fused_preprocessing': False, 'compiled': False},
+    'cascade': {'decoder': 'opencv', 'cascade': True, 'skip_duplicates': False,
+                'fused_preprocessing': False, 'compiled': False},
+}
+
+# Allowed |score - reference score| per mode (scores are 0-1); exact modes must also keep the level
+SCORE_TOLERANCE = {'reference': 0.0, 'ffmpeg': 0.05, 'fused': 0.01, 'compiled': 0.01,
+                   'fused_compiled': 0.01, 'skip_duplicates': 0.05, 'cascade': 0.15}
+APPROXIMATE_MODES = ('ffmpeg', 'skip_duplicates', 'cascade')
+
+# Relative change against the previous history entry that counts as a regression
+MAX_FPS_DROP = 0.20
+MAX_RSS_GROWTH = 0.25
+
+
+def _background(rng, width, height):
+    """Smooth random texture so the background is not trivially uniform"""
+    small = rng.integers(40, 200, size=(height // 32, width // 32, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC), (31, 31), 0)
+
+
+def build_corpus(img_dir: str = IMG_DIR, corpus_dir: str = CORPUS_DIR) -> list:
+    """Write one synthetic video per face image (skipped if it already exists)"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    width, height = FRAME_SIZE
+    paths = []
+    for index, name in enumerate(sorted(os.listdir(img_dir))):
+        face = cv2.imread(os.path.join(img_dir, name))
+        if face is None:
+            continue
+        path = os.path.join(corpus_dir, f"{os.path.splitext(name)[0]}.mp4")
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+
+        rng = np.random.default_rng(index)
+        background = _background(rng, width, height)
+        face_height = height // 2
+        face = cv2.resize(face, (int(face.shape[1] * face_height / face.shape[0]), face_height))
+        face_h, face_w = face.shape[:2]
+
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), CORPUS_FPS, FRAME_SIZE)
+        frame_total = CORPUS_FPS * CORPUS_SECONDS
+        for i in range(frame_total):
+            t = i / frame_total * 2 * np.pi
+            # Slow Lissajous path keeps the face fully inside the frame
+            x = int((width - face_w) / 2 * (1 + 0.8 * np.sin(t)))
+            y = int((height - face_h) / 2 * (1 + 0.6 * np.sin(2 * t)))
+            frame = background.copy()
+            frame[y:y + face_h, x:x + face_w] = face
+            writer.write(frame)
+        writer.release()
+        print(f"Corpus video written: {path}")
+    return paths
+
+
+def run_mode(mode: str, videos: list) -> dict:
+    """Analyze every video under one engine mode in this process"""
+    from neural_network.logging_setup import setup_logging
+    from neural_network.predict import analyze_source
+    setup_logging(level='WARNING')
+
+    results = {}
+    for video in videos:
+        start_time = time.perf_counter()
+        level, percent, details = analyze_source(video, is_video_file=True, **ENGINE_MODES[mode])
+        elapsed = time.perf_counter() - start_time
+        frames = details.get('frames_analyzed', 0)
+        timings = details.get('stage_timings', {})
+        results[os.path.basename(video)] = {
+            'level': level,
+            'score': round((percent or 0) / 100, 4),
+            'error': details.get('error'),
+            'frames': frames,
+            'elapsed_seconds': round(elapsed, 3),
+            'frames_per_second': round(frames / elapsed, 2) if elapsed else 0,
+            'stage_p50_ms': {stage: t['p50_ms'] for stage, t in timings.items()},
+            'stage_p95_ms': {stage: t['p95_ms'] for stage, t in timings.items()}
+        }
+    # ru_maxrss is in KB on Linux
+    peak_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else None
+    return {'videos': results, 'peak_rss_mb': peak_rss_mb}
+
+
+def check_scores(runs: dict) -> list:
+    failures = []
+    reference = runs.get('reference')
+    if reference is None:
+        return failures
+    for mode, run in runs.items():
+        for video, result in run['videos'].items():
+            expected = reference['videos'].get(video)
+            if expected is None:
+                continue
+            if result['error'] and not expected['error']:
+                failures.append(f"{mode}/{video}: failed with {result['error']}")
+                continue
+            delta = abs(result['score'] - expected['score'])
+            if delta > SCORE_TOLERANCE.get(mode, 0.01) + 1e-9:
+                failures.append(f"{mode}/{video}: score {result['score']} vs reference {expected['score']}")
+            if mode not in APPROXIMATE_MODES and result['level'] != expected['level']:
+                failures.append(f"{mode}/{video}: level {result['level']} vs reference {expected['level']}")
+    return failures
+
+
+def check_performance(runs: dict, previous: dict) -> list:
+    failures = []
+    if not previous:
+        return failures
+    for mode, run in runs.items():
+        before = previous.get('runs', {}).get(mode)
+        if before is None:
+            continue
+        for video, result in run['videos'].items():
+            old = before['videos'].get(video)
+            if old and old['frames_per_second'] and \
+                    result['frames_per_second'] < old['frames_per_second'] * (1 - MAX_FPS_DROP):
+                failures.append(f"{mode}/{video}: {result['frames_per_second']} fps, "
+                                f"was {old['frames_per_second']}")
+        if before['peak_rss_mb'] and run['peak_rss_mb'] and \
+                run['peak_rss_mb'] > before['peak_rss_mb'] * (1 + MAX_RSS_GROWTH):
+            failures.append(f"{mode}: peak RSS {run['peak_rss_mb']} MB, was {before['peak_rss_mb']} MB")
+    return failures
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analysis score/performance regression suite')
+    parser.add_argument('--modes', nargs='+', choices=list(ENGINE_MODES), default=list(ENGINE_MODES))
+    parser.add_argument('--videos', help='Directory with extra sample videos added to the corpus')
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--no-history', action='store_true', help='Check only, do not append to the history')
+    parser.add_argument('--run-mode', help=argparse.SUPPRESS)  # child process mode
+    parser.add_argument('--corpus', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.run_mode, args.corpus)))
+        return
+
+    videos = build_corpus()
+    if args.videos:
+        videos += sorted(os.path.join(args.videos, name) for name in os.listdir(args.videos)
+                         if name.lower().endswith(('.mp4', '.avi', '.mov', '.webm', '.mkv')))
+
+    modes = args.modes if 'reference' in args.modes else ['reference'] + args.modes
+    runs = {}
+    for mode in modes:
+        # One process per mode: separate peak RSS and no state shared between engines
+        command = [sys.executable, os.path.abspath(__file__), '--run-mode', mode, '--corpus', *videos]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        runs[mode] = json.loads(output.strip().splitlines()[-1])
+        fps = [v['frames_per_second'] for v in runs[mode]['videos'].values()]
+        print(f"{mode:<16} {np.mean(fps):>8.2f} frames/s  peak RSS {runs[mode]['peak_rss_mb']} MB")
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, encoding='utf-8') as f:
+            history = json.load(f)
+
+    failures = check_scores(runs) + check_performance(runs, history[-1] if history else None)
+    entry = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _git_commit(),
+        'runs': runs,
+        'failures': failures
+    }
+    if not args.no_history:
+        os.makedirs(os.path.dirname(args.history), exist_ok=True)
+        history.append(entry)
+        with open(args.history, 'w', encoding='utf-8') as f:
+            json.dump(history, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print('Regression suite passed' if not failures else f"{len(failures)} check(s) failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+from neural_network.model_registry import MODEL_PATH, get_model_registry
+from neural_network.inference_model import FACE_SIZE, build_inference_model, reference_preprocess, CompiledPredictor
+
+logger = logging.getLogger(__name__)
+
+# Fraction of analyses that also score their faces with the candidate (0 = off)
+SHADOW_FRACTION = float(os.environ.get('FATIGUE_SHADOW_FRACTION', 0))
+# Candidate model file (default: the production model, to compare backends only)
+SHADOW_MODEL = os.environ.get('FATIGUE_SHADOW_MODEL', MODEL_PATH)
+# Candidate backend: 'keras' (model.predict), 'compiled', 'fused' (uint8 input) or 'fused_compiled'
+SHADOW_BACKEND = os.environ.get('FATIGUE_SHADOW_BACKEND', 'compiled')
+SHADOW_LOG = os.environ.get('FATIGUE_SHADOW_LOG', 'neural_network_shadow.jsonl')
+# Crops waiting for the candidate; further crops are dropped rather than slowing analyses
+MAX_SHADOW_QUEUE = 256
+
+
+class ShadowRun:
+    """Paired primary/candidate scores of one sampled analysis"""
+
+    def __init__(self, evaluator, source, model_version):
+        self.evaluator = evaluator
+        self.run_id = uuid.uuid4().hex
+        self.source = str(source)
+        self.model_version = model_version
+        self.started_at = time.time()
+        self.pending = 0
+        self.closed = False
+        self.dropped = 0
+        self.primary_scores = []
+        self.candidate_scores = []
+        self.primary_latencies = []
+        self.candidate_latencies = []
+
+    def submit(self, face_roi: np.ndarray, primary_score: float, primary_latency: float):
+        """Queue a face crop the primary model just scored; never blocks"""
+        face = cv2.resize(face_roi, FACE_SIZE)
+        self.evaluator.submit(self, face, float(primary_score), primary_latency)
+
+    def close(self):
+        """No more crops; the record is written once the queued ones are scored"""
+        self.evaluator.close_run(self)
+
+    def summary(self) -> dict:
+        primary = np.array(self.primary_scores)
+        candidate = np.array(self.candidate_scores)
+        deltas = candidate - primary if len(primary) else np.zeros(0)
+
+        def latency_ms(values, percentile):
+            return round(float(np.percentile(values, percentile)) * 1000, 3) if values else None
+
+        return {
+            'run_id': self.run_id,
+            'source': self.source,
+            'started_at': self.started_at,
+            'primary_version': self.model_version,
+            'candidate_model': self.evaluator.model_path,
+            'candidate_version': self.evaluator.candidate_version,
+            'candidate_backend': self.evaluator.backend,
+            'faces': len(primary),
+            'dropped': self.dropped,
+            'mean_abs_delta': round(float(np.abs(deltas).mean()), 4) if len(deltas) else None,
+            'max_abs_delta': round(float(np.abs(deltas).max()), 4) if len(deltas) else None,
+            'mean_delta': round(float(deltas.mean()), 4) if len(deltas) else None,
+            'agreement': float(((primary > 0.5) == (candidate > 0.5)).mean()) if len(deltas) else None,
+            'primary_score': round(float(primary.mean()), 4) if len(primary) else None,
+            'candidate_score': round(float(candidate.mean()), 4) if len(candidate) else None,
+            'primary_latency_ms_p50': latency_ms(self.primary_latencies, 50),
+            'primary_latency_ms_p95': latency_ms(self.primary_latencies, 95),
+            'candidate_latency_ms_p50': latency_ms(self.candidate_latencies, 50),
+            'candidate_latency_ms_p95': latency_ms(self.candidate_latencies, 95)
+        }
+
+
+class ShadowEvaluator:
+    """Scores face crops of sampled analyses with a candidate model off the critical path.
+
+    Analyses hand over crops they already decoded, detected and scored; one
+    background thread loads the candidate on first use, scores the crops and,
+    when a run is closed and drained, appends its comparison to SHADOW_LOG.
+    """
+
+    def __init__(self, model_path: str = SHADOW_MODEL, backend: str = SHADOW_BACKEND,
+                 fraction: float = SHADOW_FRACTION, log_path: str = SHADOW_LOG):
+        if backend not in ('keras', 'compiled', 'fused', 'fused_compiled'):
+            raise ValueError(f"Unknown shadow backend: {backend}")
+        self.model_path = model_path
+        self.backend = backend
+        self.fraction = fraction
+        self.log_path = log_path
+        self.candidate_version = None
+        self._predict = None
+        self._channels = None
+        self._queue = queue.Queue(maxsize=MAX_SHADOW_QUEUE)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='fatigue-shadow', daemon=True)
+        self._thread.start()
+
+    def start_run(self, source, model_version):
+        """A ShadowRun for this analysis if it is sampled, otherwise None"""
+        if self.fraction <= 0 or random.random() >= self.fraction:
+            return None
+        return ShadowRun(self, source, model_version)
+
+    def submit(self, run: ShadowRun, face: np.ndarray, primary_score: float, primary_latency: float):
+        with self._lock:
+            run.pending += 1
+        try:
+            self._queue.put_nowait((run, face, primary_score, primary_latency))
+        except queue.Full:
+            with self._lock:
+                run.pending -= 1
+                run.dropped += 1
+
+    def close_run(self, run: ShadowRun):
+        with self._lock:
+            run.closed = True
+            finished = run.pending == 0
+        if finished:
+            self._write(run)
+
+    def _load_candidate(self):
+        model_version = get_model_registry(self.model_path).active()
+        self.candidate_version = model_version.version
+        model = model_version.model
+        self._channels = model.input_shape[-1]
+        if self.backend.startswith('fused'):
+            model = build_inference_model(model)
+        if self.backend.endswith('compiled'):
+            predictor = CompiledPredictor(model)
+            predictor.warmup()
+            self._predict = lambda faces: predictor.predict_on_batch(faces)
+        else:
+            self._predict = lambda faces: model.predict(faces, verbose=0)
+        logger.info(f"Shadow candidate ready: {self.model_path} ({self.candidate_version}), backend {self.backend}")
+
+    def _score(self, face: np.ndarray) -> float:
+        if not self.backend.startswith('fused'):
+            face = reference_preprocess(face, self._channels)
+        return float(np.asarray(self._predict(face[None, ...])).reshape(-1)[0])
+
+    def _run(self):
+        while True:
+            run, face, primary_score, primary_latency = self._queue.get()
+            try:
+                if self._predict is None:
+                    self._load_candidate()
+                start_time = time.perf_counter()
+                candidate_score = self._score(face)
+                candidate_latency = time.perf_counter() - start_time
+            except Exception as e:
+                logger.error(f"Shadow scoring failed: {e}")
+                candidate_score = None
+                if self._predict is None:
+                    self.fraction = 0  # candidate did not load: stop sampling new analyses
+
+            with self._lock:
+                if candidate_score is not None:
+                    run.primary_scores.append(primary_score)
+                    run.candidate_scores.append(candidate_score)
+                    run.primary_latencies.append(primary_latency)
+                    run.candidate_latencies.append(candidate_latency)
+                run.pending -= 1
+                finished = run.closed and run.pending == 0
+            if finished:
+                self._write(run)
+
+    def _write(self, run: ShadowRun):
+        summary = run.summary()
+        logger.info(f"Shadow comparison: {summary}")
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(summary) + '\n')
+        except OSError as e:
+            logger.error(f"Failed to write shadow log {self.log_path}: {e}")
+
+
+_EVALUATOR = None
+_EVALUATOR_LOCK = threading.Lock()
+
+
+def start_shadow_run(source, model_version):
+    """ShadowRun for a new analysis when shadow mode samples it, else None"""
+    global _EVALUATOR
+    if SHADOW_FRACTION <= 0:
+        return None
+    with _EVALUATOR_LOCK:
+        if _EVALUATOR is None:
+            _EVALUATOR = ShadowEvaluator()
+    return _EVALUATOR.start_run(source, model_version)
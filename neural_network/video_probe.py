@@ -0,0 +1,190 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Limits applied before any frame is decoded
+MAX_VIDEO_LENGTH = int(os.environ.get('MAX_VIDEO_LENGTH', 300))  # seconds, uploads
+MAX_FLIGHT_VIDEO_LENGTH = int(os.environ.get('MAX_FLIGHT_VIDEO_LENGTH', 6 * 3600))  # seconds
+MIN_RESOLUTION = (64, 64)
+MAX_RESOLUTION = (7680, 4320)
+
+# Decoded frames wider than this are downscaled before face detection
+MAX_ANALYSIS_WIDTH = 1280
+
+# Higher reported rates are container time bases (e.g. 1000/1 in MediaRecorder WebM), not frame rates
+MAX_PLAUSIBLE_FPS = 240
+# Sampling rate for videos whose duration is unknown
+UNKNOWN_DURATION_TARGET_FPS = 10.0
+
+
+class VideoRejected(ValueError):
+    """Raised when a probed video does not satisfy the analysis limits"""
+
+
+def _parse_rate(rate: str) -> float:
+    """Parse an ffprobe rational like '30000/1001'"""
+    try:
+        num, _, den = rate.partition('/')
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _probe_ffprobe(path: str) -> dict:
+    import ffmpeg
+
+    info = ffmpeg.probe(path, select_streams='v:0')
+    stream = info['streams'][0]
+    fmt = info.get('format', {})
+
+    width = int(stream.get('width') or 0)
+    height = int(stream.get('height') or 0)
+    fps = _parse_rate(stream.get('avg_frame_rate', '0/1')) or _parse_rate(stream.get('r_frame_rate', '0/1'))
+    if fps > MAX_PLAUSIBLE_FPS:
+        fps = 0.0
+    duration = float(stream.get('duration') or fmt.get('duration') or 0)
+    frame_count = int(stream.get('nb_frames') or 0) or int(round(duration * fps))
+
+    if not frame_count:
+        # Streamed WebM (browser MediaRecorder) has no duration, cues or frame count in the
+        # header: count packets instead, this demuxes the file but decodes nothing
+        try:
+            counted = ffmpeg.probe(path, select_streams='v:0', count_packets=None)['streams'][0]
+            frame_count = int(counted.get('nb_read_packets') or 0)
+        except Exception as e:
+            logger.debug(f"Packet count failed for {path}: {e}")
+        if frame_count and not duration and fps:
+            duration = frame_count / fps
+
+    return {
+        'width': width,
+        'height': height,
+        'fps': fps,
+        'duration': duration,
+        'frame_count': frame_count,
+        'codec': stream.get('codec_name')
+    }
+
+
+def _probe_opencv(path: str) -> dict:
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise VideoRejected(f"Video stream could not be decoded: {path}")
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        if fps > MAX_PLAUSIBLE_FPS:
+            fps = 0.0
+        # Negative or zero for containers without an index: unknown
+        frame_count = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    finally:
+        cap.release()
+
+    codec = ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00 ') or None
+    return {
+        'width': width,
+        'height': height,
+        'fps': fps,
+        'duration': frame_count / fps if fps else 0.0,
+        'frame_count': frame_count,
+        'codec': codec
+    }
+
+
+def probe_video(path: str) -> dict:
+    """Read container/stream metadata without decoding frames.
+
+    Uses ffprobe (via ffmpeg-python) and falls back to OpenCV when ffprobe is
+    not installed. The returned keys match the FatigueVideos catalog columns.
+    fps, duration and frame_count are 0 when the container does not record
+    them; that means unknown, not empty.
+    """
+    start_time = time.perf_counter()
+    try:
+        info = _probe_ffprobe(path)
+        backend = 'ffprobe'
+    except (ImportError, FileNotFoundError) as e:
+        logger.debug(f"ffprobe unavailable ({e}), probing with OpenCV")
+        info = _probe_opencv(path)
+        backend = 'opencv'
+    except Exception as e:
+        # ffmpeg.Error: ffprobe ran but could not parse the container
+        raise VideoRejected(f"Video stream could not be decoded: {path}") from e
+
+    width, height = info['width'], info['height']
+    info['resolution'] = f"{width}x{height}" if width and height else None
+    info['probe_backend'] = backend
+    info['probe_ms'] = round((time.perf_counter() - start_time) * 1000, 2)
+    logger.info(f"Probed {path}: {info}")
+    return info
+
+
+def _resolution(video_info: dict) -> tuple:
+    if video_info.get('width') and video_info.get('height'):
+        return int(video_info['width']), int(video_info['height'])
+    if video_info.get('resolution'):
+        width, height = video_info['resolution'].split('x')
+        return int(width), int(height)
+    return 0, 0
+
+
+def check_video_limits(video_info: dict, max_duration: float = MAX_VIDEO_LENGTH):
+    """Raise VideoRejected if the video cannot or should not be analyzed"""
+    width, height = _resolution(video_info)
+    if not width or not height:
+        raise VideoRejected('Video stream could not be decoded')
+    if width < MIN_RESOLUTION[0] or height < MIN_RESOLUTION[1]:
+        raise VideoRejected(f'Video resolution {width}x{height} is too small')
+    if width > MAX_RESOLUTION[0] or height > MAX_RESOLUTION[1]:
+        raise VideoRejected(f'Video resolution {width}x{height} is too large')
+
+    # Unknown duration (0) is enforced while decoding instead, see analyze_source
+    duration = video_info.get('duration') or 0
+    if max_duration and duration > max_duration:
+        raise VideoRejected(f'Video is too long ({duration:.0f}s, limit {max_duration:.0f}s)')
+
+
+def choose_analysis_strategy(video_info: dict) -> dict:
+    """Pick sampling rate, analysis resolution and early-abort threshold.
+
+    Short clips are analyzed frame by frame; longer recordings are sampled so
+    that analysis cost grows with duration much more slowly than decoding.
+    """
+    width, height = _resolution(video_info)
+    fps = video_info.get('fps') or 30.0
+    duration = video_info.get('duration') or 0
+    frame_count = video_info.get('frame_count') or 0
+
+    if not duration:
+        target_fps = min(fps, UNKNOWN_DURATION_TARGET_FPS)  # length unknown: assume a longer video
+    elif duration <= 60:
+        target_fps = fps
+    elif duration <= 10 * 60:
+        target_fps = 10.0
+    elif duration <= 60 * 60:
+        target_fps = 5.0
+    else:
+        target_fps = 2.0
+
+    frame_step = max(1, int(round(fps / target_fps)))
+
+    scale = min(1.0, MAX_ANALYSIS_WIDTH / width) if width else 1.0
+
+    # Stop early if no face shows up in the first part of the video
+    sampled_frames = frame_count // frame_step if frame_count else 0
+    no_face_abort_frames = max(150, sampled_frames // 4)
+
+    return {
+        'frame_step': frame_step,
+        'analysis_fps': fps / frame_step,
+        'scale': scale,
+        'analysis_resolution': f"{int(width * scale)}x{int(height * scale)}",
+        'no_face_abort_frames': no_face_abort_frames,
+        'duration_known': bool(duration)
+    }
@@ -9,13 +9,16 @@ import sqlite3
 
 # Import blueprints
 from blueprints.auth import auth_bp, AuthError, handle_auth_error
-from blueprints.fatigue_analysis import fatigue_bp
+from blueprints.fatigue_analysis import fatigue_bp, start_post_arrival_scheduler
 from blueprints.cognitive_tests import cognitive_bp
 from blueprints.user_data import user_bp
 from blueprints.feedback import feedback_bp
 from blueprints.debug import debug_bp
+from neural_network.cpu_budget import configure_threads
+from neural_network.logging_setup import setup_logging
 
 # ... keep existing code (logging setup)
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +33,9 @@ app.config['SECRET_KEY'] = os.urandom(24).hex()
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
 app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
 
+# Size TensorFlow/OpenCV thread pools and analysis workers from one CPU budget
+configure_threads()
+
 # Database helper function
 def get_db_connection():
     conn = sqlite3.connect('database/database.db')
@@ -240,4 +246,8 @@ app.register_blueprint(debug_bp)
 test_sessions = {}
 
 if __name__ == '__main__':
+    # With the debug reloader only the serving child process schedules analyses
+    # (run.py starts the app without the reloader and starts the scheduler itself)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_post_arrival_scheduler()
     app.run(debug=True, port=5000)
@@ -41,6 +41,8 @@ def run_backend():
             
         # Import the Flask app from routes.py
         from routes import app
+        from blueprints.fatigue_analysis import start_post_arrival_scheduler
+        start_post_arrival_scheduler()  # no reloader here, this is the serving process
         app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
     except ImportError:
         print("ОШИБКА: Не удалось импортировать Flask-приложение из routes.py")
@@ -41,6 +41,11 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// Интервал опроса фонового анализа рейса (мс)
+const FLIGHT_JOB_POLL_INTERVAL = 3000;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
 // Улучшенная функция для парсинга дат
 const parseAnalysisDate = (dateString: string): Date => {
   try {
@@ -183,13 +188,41 @@ export function useFatigueAnalysis(onAnalysisComplete?: (result: AnalysisResult)
       return;
     }
 
-    setAnalysisProgress({ loading: true, message: "Анализ рейса...", percent: 50 });
+    setAnalysisProgress({ loading: true, message: "Анализ рейса...", percent: 0 });
 
     try {
-      const response = await api.post("/api/fatigue/analyze-flight", {
+      // 202 означает, что анализ идет в фоне: ждем завершения задачи и запрашиваем результат снова
+      let response = await api.post("/api/fatigue/analyze-flight", {
         flight_id: flight.flight_id,
         video_path: flight.video_path
       });
+      while (response.status === 202) {
+        const jobId = response.data.job_id;
+        while (true) {
+          await sleep(FLIGHT_JOB_POLL_INTERVAL);
+          let job;
+          try {
+            job = (await api.get(`/api/fatigue/progress/${jobId}`, { params: { format: "json" } })).data;
+          } catch (error: any) {
+            // Задача завершена и удалена или выполняется в другом процессе
+            if (error.response?.status === 404) break;
+            throw error;
+          }
+          if (job.state === "failed") {
+            throw { jobError: job.error };
+          }
+          if (job.state === "done") break;
+          const progress = job.progress;
+          const percent = progress?.expected_frames
+            ? Math.min(99, Math.round(progress.frames_processed / progress.expected_frames * 100))
+            : 0;
+          setAnalysisProgress({ loading: true, message: "Анализ рейса...", percent });
+        }
+        response = await api.post("/api/fatigue/analyze-flight", {
+          flight_id: flight.flight_id,
+          video_path: flight.video_path
+        });
+      }
 
       const result = response.data;
       setAnalysisResult(result);
@@ -213,6 +246,8 @@ export function useFatigueAnalysis(onAnalysisComplete?: (result: AnalysisResult)
       let errorMessage = "Ошибка при анализе рейса";
       if (error.response?.data?.error) {
         errorMessage = error.response.data.error;
+      } else if (error.jobError) {
+        errorMessage = error.jobError;
       }
 
       toast({
@@ -0,0 +1,114 @@
+"""
+Background execution of fatigue analyses.
+
+Jobs run on a small thread pool so HTTP handlers can return immediately;
+their state is kept in memory and looked up by job id.
+"""
+
+import time
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from neural_network.cpu_budget import THREAD_BUDGET
+
+logger = logging.getLogger(__name__)
+
+# FATIGUE_ANALYSIS_WORKERS, or derived from the CPU budget (see cpu_budget.py)
+ANALYSIS_WORKERS = THREAD_BUDGET['analysis_workers']
+# Finished jobs are forgotten after this many seconds
+JOB_TTL = 3600
+# A running job without progress updates for this long is reported as stalled
+STALL_TIMEOUT = 60
+
+
+class JobExistsError(ValueError):
+    """Raised by create_job when the job id is already taken"""
+
+
+_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix='fatigue-analysis')
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _prune_jobs(now):
+    expired = [job_id for job_id, job in _jobs.items()
+               if job['state'] in ('done', 'failed') and now - job['updated_at'] > JOB_TTL]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def update_job(job_id, **fields):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        job['updated_at'] = time.time()
+
+
+def get_job(job_id):
+    """Return a snapshot of the job state or None"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = dict(job)
+    snapshot['stalled'] = (snapshot['state'] == 'running'
+                           and time.time() - snapshot['updated_at'] > STALL_TIMEOUT)
+    return snapshot
+
+
+def progress_reporter(job_id):
+    """Callback for analyze_source(progress_callback=...) that stores progress on the job"""
+    def report(progress):
+        update_job(job_id, progress=progress)
+    return report
+
+
+def create_job(job_id, employee_id=None, state='queued', employee_ids=None):
+    """Register a job so its progress can be followed (also used for synchronous analyses).
+    
+    employee_ids lists everyone who may follow the job (a whole crew), it defaults to employee_id.
+    Raises JobExistsError if job_id is in use (client-chosen ids must not replace another job).
+    """
+    now = time.time()
+    with _jobs_lock:
+        _prune_jobs(now)
+        if job_id in _jobs:
+            raise JobExistsError(f"Job {job_id} already exists")
+        _jobs[job_id] = {
+            'job_id': job_id,
+            'employee_id': employee_id,
+            'employee_ids': list(employee_ids) if employee_ids else [employee_id],
+            'state': state,
+            'created_at': now,
+            'updated_at': now,
+            'progress': None,
+            'result': None,
+            'error': None
+        }
+    return job_id
+
+
+def _run_job(job_id, fn, args, kwargs):
+    update_job(job_id, state='running', started_at=time.time())
+    try:
+        result = fn(*args, **kwargs)
+        update_job(job_id, state='done', result=result)
+    except Exception as e:
+        logger.error(f"Analysis job {job_id} failed: {traceback.format_exc()}")
+        update_job(job_id, state='failed', error=str(e))
+
+
+def start_job(job_id, fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) in the background under a job registered with create_job"""
+    _executor.submit(_run_job, job_id, fn, args, kwargs)
+    return job_id
+
+
+def submit_job(job_id, fn, *args, employee_id=None, employee_ids=None, **kwargs):
+    """Run fn(*args, **kwargs) in the background under job_id"""
+    create_job(job_id, employee_id=employee_id, employee_ids=employee_ids)
+    return start_job(job_id, fn, *args, **kwargs)
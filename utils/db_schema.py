@@ -0,0 +1,50 @@
+"""
+Idempotent schema upgrades for databases created by an older database/init_db.py.
+
+init_db.py always recreates the schema from scratch; existing databases only
+need the columns and indexes that were added later, which ensure_schema()
+applies on first use.
+"""
+
+import sqlite3
+
+# (table, column, column definition)
+SCHEMA_COLUMNS = [
+    ('FatigueVideos', 'file_size', 'INTEGER'),
+    ('FatigueVideos', 'content_hash', 'TEXT'),
+    ('FatigueVideos', 'codec', 'TEXT'),
+    ('FatigueVideos', 'frame_count', 'INTEGER'),
+    ('FatigueVideos', 'file_name', 'TEXT'),
+    ('FatigueVideos', 'file_mtime', 'REAL'),
+    ('FatigueAnalysis', 'analysis_status',
+     "TEXT DEFAULT 'final' CHECK(analysis_status IN ('provisional', 'final', 'failed'))"),
+    ('FatigueAnalysis', 'model_version', 'TEXT'),
+    ('Flights', 'analysis_attempts', 'INTEGER DEFAULT 0'),
+    ('Flights', 'analysis_failed_at', 'TEXT'),
+    ('Flights', 'analysis_error', 'TEXT'),
+]
+
+SCHEMA_INDEXES = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_fatigue_videos_path ON FatigueVideos(video_path)',
+    'CREATE INDEX IF NOT EXISTS idx_fatigue_videos_hash ON FatigueVideos(content_hash)',
+    'CREATE INDEX IF NOT EXISTS idx_fatigue_videos_name ON FatigueVideos(file_name)',
+]
+
+_schema_checked = set()
+
+
+def ensure_schema(conn: sqlite3.Connection, db_path: str = 'database/database.db'):
+    """Add missing columns and indexes (runs once per database per process)"""
+    if db_path in _schema_checked:
+        return
+
+    for table, column, definition in SCHEMA_COLUMNS:
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if existing and column not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    for statement in SCHEMA_INDEXES:
+        conn.execute(statement)
+
+    conn.commit()
+    _schema_checked.add(db_path)
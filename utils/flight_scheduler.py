@@ -0,0 +1,299 @@
+"""
+Post-arrival background analysis of flight videos.
+
+Once a flight has arrived, its video is analyzed a single time for every
+crew member who has no 'flight' analysis yet. The work runs on the
+analysis job pool and only during off-peak hours, so
+/api/fatigue/analyze-flight can return the stored result immediately.
+Failures are stored on the flight row: errors in the video itself (not
+found, unsuitable, no face) are not retried, other errors are retried
+after RETRY_DELAY at most MAX_ATTEMPTS times.
+
+When several web worker processes run the scheduler, one of them holds a
+file lock and does the scheduling; the others stay idle. Every flight
+analysis (scheduled or requested) also holds a per-flight lock file that
+names its job, so any worker can tell that a flight is being analyzed.
+"""
+
+import os
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from utils.analysis_jobs import submit_job, get_job
+from utils.db_schema import ensure_schema
+from neural_network.file_lock import try_lock, unlock
+
+logger = logging.getLogger(__name__)
+
+AUTO_ANALYSIS_ENABLED = os.environ.get('FATIGUE_AUTO_ANALYSIS', '0') == '1'
+# Seconds after arrival_time before a flight is picked up (the video upload needs time)
+AUTO_ANALYSIS_DELAY = int(os.environ.get('FATIGUE_AUTO_ANALYSIS_DELAY', 15 * 60))
+POLL_INTERVAL = float(os.environ.get('FATIGUE_AUTO_ANALYSIS_POLL', 60))
+# Local hours 'start-end' in which scheduled analyses may start; empty means any time
+OFF_PEAK_HOURS = os.environ.get('FATIGUE_OFF_PEAK_HOURS', '22-6')
+# Scheduled analyses running at once, the rest of the pool is left to interactive requests
+MAX_SCHEDULED_JOBS = int(os.environ.get('FATIGUE_AUTO_ANALYSIS_JOBS', 1))
+# Analyze with flight-phase windows (see neural_network/flight_phases.py)
+AUTO_ANALYSIS_PHASES = os.environ.get('FATIGUE_AUTO_ANALYSIS_PHASES', '0') == '1'
+# Flights that arrived longer ago are left to manual analysis
+LOOKBACK_DAYS = 7
+# A failed flight is retried after this many seconds, up to MAX_ATTEMPTS analyses in total
+RETRY_DELAY = 6 * 3600
+MAX_ATTEMPTS = 3
+# claim_flight retries briefly: flight_job() holds a flight's lock for a moment while probing it
+CLAIM_ATTEMPTS = 3
+CLAIM_RETRY_DELAY = 0.05
+
+DB_PATH = 'database/database.db'
+LOCK_FILE = os.path.join('database', 'flight_scheduler.lock')
+FLIGHT_LOCK_DIR = os.path.join('database', 'flight_analysis')
+
+
+def parse_hours(spec: str):
+    """'22-6' -> (22, 6); empty -> None"""
+    if not spec:
+        return None
+    start, _, end = spec.partition('-')
+    return int(start), int(end)
+
+
+def is_off_peak(now: datetime, hours) -> bool:
+    if hours is None:
+        return True
+    start, end = hours
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end  # window over midnight
+
+
+def _flight_lock_path(flight_id) -> str:
+    return os.path.join(FLIGHT_LOCK_DIR, f"{flight_id}.lock")
+
+
+def unanalyzed_employees(conn, flight_id, employee_ids) -> list:
+    """The employee ids without a 'flight' analysis of this flight"""
+    analyzed = {row[0] for row in conn.execute(f'''
+        SELECT employee_id FROM FatigueAnalysis
+        WHERE flight_id = ? AND analysis_type = 'flight'
+            AND employee_id IN ({','.join('?' * len(employee_ids))})
+    ''', (flight_id, *employee_ids))}
+    return [employee_id for employee_id in employee_ids if employee_id not in analyzed]
+
+
+def claim_flight(flight_id, job_id, employee_ids, db_path: str = DB_PATH):
+    """Mark a flight as being analyzed under job_id.
+    
+    Returns (handle for release_flight, employee ids still without an analysis),
+    or (None, []) when another analysis holds the flight. The ids are checked
+    again under the lock: a pending list read before it may be stale.
+    """
+    os.makedirs(FLIGHT_LOCK_DIR, exist_ok=True)
+    for attempt in range(CLAIM_ATTEMPTS):
+        handle = try_lock(_flight_lock_path(flight_id))
+        if handle is not None:
+            break
+        time.sleep(CLAIM_RETRY_DELAY)
+    else:
+        return None, []
+    handle.seek(0)
+    handle.truncate()
+    # Written after the first byte locked on Windows, so other processes can read it
+    handle.write(f" {job_id}")
+    handle.flush()
+
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            remaining = unanalyzed_employees(conn, flight_id, list(employee_ids))
+        finally:
+            conn.close()
+    except Exception:
+        unlock(handle, remove=True)
+        raise
+    return handle, remaining
+
+
+def release_flight(handle):
+    unlock(handle, remove=True)
+
+
+def flight_job(flight_id):
+    """Job id of the analysis of this flight running in any process, else None"""
+    path = _flight_lock_path(flight_id)
+    if not os.path.exists(path):
+        return None
+    handle = try_lock(path)
+    if handle is not None:
+        unlock(handle, remove=True)
+        return None
+    try:
+        with open(path) as f:
+            f.seek(1)
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def record_flight_failure(conn, flight_id, error: Exception):
+    """Store a failed scheduled analysis; errors with a 4xx status_code are in the video and final"""
+    status_code = getattr(error, 'status_code', None)
+    permanent = status_code is not None and status_code < 500
+    conn.execute('''
+        UPDATE Flights
+        SET analysis_attempts = CASE WHEN ? THEN ? ELSE COALESCE(analysis_attempts, 0) + 1 END,
+            analysis_failed_at = ?,
+            analysis_error = ?
+        WHERE flight_id = ?
+    ''', (permanent, MAX_ATTEMPTS, datetime.now().isoformat(), str(error), flight_id))
+    conn.commit()
+
+
+def pending_flight_analyses(conn, now: datetime) -> list:
+    """[(flight row, [employee_id, ...])] for arrived flights with crew members not yet analyzed"""
+    rows = conn.execute('''
+        SELECT f.flight_id, f.from_code, f.to_code, f.video_path, f.departure_time, f.arrival_time,
+               cm.employee_id
+        FROM Flights f
+        JOIN CrewMembers cm ON cm.crew_id = f.crew_id
+        WHERE f.video_path IS NOT NULL AND f.video_path != ''
+            AND f.status != 'cancelled'
+            AND datetime(f.arrival_time) <= datetime(?)
+            AND datetime(f.arrival_time) >= datetime(?)
+            AND COALESCE(f.analysis_attempts, 0) < ?
+            AND (f.analysis_failed_at IS NULL OR datetime(f.analysis_failed_at) <= datetime(?))
+            AND NOT EXISTS (
+                SELECT 1 FROM FatigueAnalysis fa
+                WHERE fa.employee_id = cm.employee_id
+                    AND fa.flight_id = f.flight_id
+                    AND fa.analysis_type = 'flight'
+            )
+        ORDER BY f.arrival_time, f.flight_id
+    ''', ((now - timedelta(seconds=AUTO_ANALYSIS_DELAY)).isoformat(),
+          (now - timedelta(days=LOOKBACK_DAYS)).isoformat(),
+          MAX_ATTEMPTS, (now - timedelta(seconds=RETRY_DELAY)).isoformat())).fetchall()
+
+    flights = {}
+    for row in rows:
+        flight, employee_ids = flights.setdefault(row['flight_id'], (row, []))
+        employee_ids.append(row['employee_id'])
+    return list(flights.values())
+
+
+class FlightScheduler:
+    """Polls for arrived flights and submits one analysis job per flight"""
+
+    def __init__(self, db_path: str = DB_PATH, lock_file: str = LOCK_FILE):
+        self.db_path = db_path
+        self.lock_file = lock_file
+        self.hours = parse_hours(OFF_PEAK_HOURS)
+        self.analyze_fn = None
+        self._jobs = {}  # flight_id -> job_id of a scheduled analysis in progress
+        self._lock = threading.Lock()
+        self._lock_fd = None
+        self._thread = None
+
+    def start(self, analyze_fn) -> bool:
+        """Run the polling thread if no other process does; False when another one holds the lock"""
+        if self._thread is not None:
+            return True
+        self.analyze_fn = analyze_fn
+        self._lock_fd = try_lock(self.lock_file)
+        if self._lock_fd is None:
+            logger.info("Flight scheduler runs in another process")
+            return False
+
+        self._thread = threading.Thread(target=self._poll, name='flight-scheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"Flight scheduler started: delay {AUTO_ANALYSIS_DELAY}s, "
+                    f"off-peak hours {OFF_PEAK_HOURS or 'any'}, {MAX_SCHEDULED_JOBS} job(s) at a time")
+        return True
+
+    def _poll(self):
+        while True:
+            try:
+                self.poll_once()
+            except Exception:
+                logger.error(f"Flight scheduler poll failed: {traceback.format_exc()}")
+            time.sleep(POLL_INTERVAL)
+
+    def poll_once(self, now: datetime = None) -> list:
+        """Submit analyses for flights that are due; returns the submitted job ids"""
+        now = now or datetime.now()
+        if not is_off_peak(now, self.hours):
+            return []
+
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            ensure_schema(conn, self.db_path)
+            pending = pending_flight_analyses(conn, now)
+        finally:
+            conn.close()
+
+        submitted = []
+        for flight, employee_ids in pending:
+            with self._lock:
+                if len(self._jobs) >= MAX_SCHEDULED_JOBS:
+                    break
+                if flight['flight_id'] in self._jobs or flight_job(flight['flight_id']):
+                    continue
+                job_id = f"flight-{flight['flight_id']}-{uuid.uuid4().hex[:8]}"
+                self._jobs[flight['flight_id']] = job_id
+            logger.info(f"Scheduling analysis of flight {flight['flight_id']} for employees {employee_ids}")
+            submit_job(job_id, self._run, dict(flight), employee_ids, job_id, employee_ids=employee_ids)
+            submitted.append(job_id)
+        return submitted
+
+    def _run(self, flight, employee_ids, job_id):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            analysis_ids, level, percent, details, output_name = self.analyze_fn(
+                conn, flight, employee_ids, flight['video_path'], job_id, job_id,
+                phase_aware=AUTO_ANALYSIS_PHASES
+            )
+            logger.info(f"Flight {flight['flight_id']} analyzed: {level} ({percent}%), "
+                        f"analyses {analysis_ids}")
+            return {'analysis_ids': analysis_ids, 'fatigue_level': level, 'video_path': output_name}
+        except Exception as e:
+            # 409: analyzed or being analyzed by a request meanwhile, not a failure of the flight
+            if getattr(e, 'status_code', None) != 409:
+                record_flight_failure(conn, flight['flight_id'], e)
+            raise
+        finally:
+            conn.close()
+            with self._lock:
+                self._jobs.pop(flight['flight_id'], None)
+
+    def status(self) -> dict:
+        with self._lock:
+            jobs = dict(self._jobs)
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            ensure_schema(conn, self.db_path)
+            failed = conn.execute('''
+                SELECT flight_id, analysis_attempts, analysis_failed_at, analysis_error
+                FROM Flights
+                WHERE analysis_failed_at IS NOT NULL AND datetime(arrival_time) >= datetime(?)
+                ORDER BY flight_id
+            ''', ((datetime.now() - timedelta(days=LOOKBACK_DAYS)).isoformat(),)).fetchall()
+        finally:
+            conn.close()
+        return {
+            'running': self._thread is not None,
+            'jobs': {flight_id: get_job(job_id) for flight_id, job_id in jobs.items()},
+            'failed_flights': [dict(row, retried=row['analysis_attempts'] < MAX_ATTEMPTS) for row in failed]
+        }
+
+
+_SCHEDULER = FlightScheduler()
+
+
+def get_flight_scheduler() -> FlightScheduler:
+    return _SCHEDULER
@@ -0,0 +1,141 @@
+"""
+Video catalog backed by the FatigueVideos table.
+
+Videos are registered once at ingest time together with their size, mtime,
+content hash and stream metadata, so later lookups are a single indexed query
+instead of walking the video directory and re-opening the file with OpenCV.
+A row is only trusted while the file's size and mtime match (is_video_current).
+"""
+
+import hashlib
+import os
+import sqlite3
+
+from neural_network.video_probe import probe_video, VideoRejected
+from utils.date_utils import get_current_datetime
+from utils.db_schema import ensure_schema
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def compute_file_hash(path: str) -> str:
+    """SHA-256 of the file contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def probe_video_metadata(path: str) -> dict:
+    """Read resolution, fps, frame count, duration and codec of a video file"""
+    try:
+        info = probe_video(path)
+    except VideoRejected:
+        return {'resolution': None, 'fps': 0.0, 'frame_count': 0, 'duration': 0, 'codec': None}
+
+    return {
+        'resolution': info['resolution'],
+        'fps': info['fps'],
+        'frame_count': info['frame_count'],
+        'duration': int(round(info['duration'])),
+        'codec': info['codec']
+    }
+
+
+def register_video(conn: sqlite3.Connection, video_dir: str, video_path: str,
+                   employee_id: int, original_filename: str = None) -> dict:
+    """Probe a video stored under video_dir and upsert it into the catalog.
+
+    video_path is relative to video_dir (normally just the filename), matching
+    what FatigueAnalysis.video_path stores.
+    """
+    ensure_schema(conn)
+
+    full_path = os.path.join(video_dir, video_path)
+    stat = os.stat(full_path)
+    metadata = probe_video_metadata(full_path)
+    content_hash = compute_file_hash(full_path)
+
+    conn.execute('''
+        INSERT INTO FatigueVideos
+        (employee_id, video_path, upload_date, original_filename, resolution,
+         fps, duration, file_size, content_hash, codec, frame_count, file_name, file_mtime)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(video_path) DO UPDATE SET
+            resolution = excluded.resolution,
+            fps = excluded.fps,
+            duration = excluded.duration,
+            file_size = excluded.file_size,
+            content_hash = excluded.content_hash,
+            codec = excluded.codec,
+            frame_count = excluded.frame_count,
+            file_name = excluded.file_name,
+            file_mtime = excluded.file_mtime
+    ''', (
+        employee_id,
+        video_path,
+        get_current_datetime(),
+        original_filename,
+        metadata['resolution'],
+        metadata['fps'],
+        metadata['duration'],
+        stat.st_size,
+        content_hash,
+        metadata['codec'],
+        metadata['frame_count'],
+        os.path.basename(video_path),
+        stat.st_mtime
+    ))
+    conn.commit()
+
+    return find_video(conn, video_path)
+
+
+def find_video(conn: sqlite3.Connection, video_path: str) -> dict:
+    """Look up a catalogued video by its stored path or bare filename"""
+    ensure_schema(conn)
+
+    cursor = conn.execute(
+        'SELECT * FROM FatigueVideos WHERE video_path = ?', (video_path,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        # Videos in subdirectories are requested by filename only
+        cursor = conn.execute(
+            'SELECT * FROM FatigueVideos WHERE file_name = ? ORDER BY video_id LIMIT 1',
+            (os.path.basename(video_path),)
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+
+    return dict(zip([column[0] for column in cursor.description], row))
+
+
+def is_video_current(video_dir: str, video: dict) -> bool:
+    """True while the catalogued file exists with the size and mtime it was registered with"""
+    try:
+        stat = os.stat(os.path.join(video_dir, video['video_path']))
+    except OSError:
+        return False
+    return stat.st_size == video.get('file_size') and stat.st_mtime == video.get('file_mtime')
+
+
+def remove_video(conn: sqlite3.Connection, video_path: str):
+    """Drop a catalog entry (e.g. after the file was deleted)"""
+    ensure_schema(conn)
+    conn.execute('DELETE FROM FatigueVideos WHERE video_path = ?', (video_path,))
+    conn.commit()
+
+
+def is_video_suitable(video: dict) -> tuple:
+    """Check catalog metadata before decoding. Returns (ok, reason)"""
+    if not video:
+        return False, 'Video is not catalogued'
+    if not video.get('file_size'):
+        return False, 'Video file is empty'
+    # frame_count/duration may be 0 (unknown) for streamed WebM; only an unreadable stream is rejected
+    if not video.get('resolution'):
+        return False, 'Video stream could not be decoded'
+    return True, None